@@ -0,0 +1,181 @@
+"""
+FoodFinder
+by Kenneth Tran
+
+Serve recommendations as JSON, both from the Flask app and from an ASGI server.
+
+GET /api/recommendations?keyword=Stress&foods=Pizza,Chips[&limit=5][&offset=0]
+
+To serve the API from an ASGI server (for example uvicorn) without Flask:
+    uvicorn --factory api:create_default_asgi_app
+"""
+
+import asyncio
+import json
+import os
+from concurrent.futures import Executor
+from typing import Any, Awaitable, Callable, Mapping, Optional, Union
+from urllib.parse import parse_qsl
+
+import load
+import recommendation
+from cache import RecommendationCache
+from graph import ComfortFoodGraph
+from random_walk import RandomWalkRecommender
+from scoring import ScoringPipeline
+from similarity import SimilarityEngine, SimilarityTable
+from warmup import WarmupTable
+
+# The default and maximum number of recommendations per response
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 50
+
+
+def recommend(graph: ComfortFoodGraph, keyword: str, liked_foods: set[str], limit: int,
+              offset: int = 0,
+              engine: Optional[Union[SimilarityEngine, SimilarityTable]] = None,
+              cache: Optional[RecommendationCache] = None,
+              scorer: Optional[Union[ScoringPipeline, RandomWalkRecommender]] = None,
+              warmup: Optional[WarmupTable] = None) -> dict[str, float]:
+    """Return the foods ranked offset + 1 to offset + limit for the keyword and the liked
+    foods, in order, each mapped to its score. Both the HTML and the JSON recommendations
+    are computed here.
+
+    If `scorer` is given, the foods are scored by it instead of by
+    recommendation.score_comfort_foods. Otherwise, if `warmup` is given and was built from
+    graph, the recommendations for a single liked food are merged from its precomputed
+    lists. Computed scores are looked up in and added to `cache`, if it is given.
+    """
+    # The warm-up table only has the ranked candidates of the graph it was built from
+    if warmup is not None and scorer is None and len(liked_foods) == 1 and warmup.graph is graph:
+        return warmup.recommend_scores(keyword, next(iter(liked_foods)), limit, offset)
+
+    def compute() -> dict[str, float]:
+        """Return freshly computed recommendation scores for this query."""
+        if scorer is not None:
+            return scorer.score(keyword, liked_foods)
+
+        return recommendation.score_comfort_foods(graph, keyword, liked_foods, engine)
+
+    if cache is not None:
+        scores = cache.lookup(graph, keyword, liked_foods, compute)
+    else:
+        scores = compute()
+
+    return {food: scores[food] for food in recommendation.select_top(scores, limit, offset)}
+
+
+def recommendation_response(graph: ComfortFoodGraph, args: Mapping[str, str],
+                            engine: Optional[Union[SimilarityEngine, SimilarityTable]] = None,
+                            cache: Optional[RecommendationCache] = None,
+                            scorer: Optional[Union[ScoringPipeline,
+                                                    RandomWalkRecommender]] = None,
+                            warmup: Optional[WarmupTable] = None) \
+        -> tuple[int, dict[str, Any]]:
+    """Return the HTTP status and the JSON body of a response to a recommendations request
+    with the given query arguments.
+
+    The arguments are a `keyword`, a comma-separated list of liked `foods`, and optionally
+    the `limit` and `offset` of the page of recommendations to return. Errors are returned
+    with a 400 status and an "error" message. The response holds the version of the graph
+    the recommendations were computed from.
+
+    The recommendations are computed by recommend, with the given `engine`, `cache`,
+    `scorer` and `warmup`.
+    """
+    keyword = args.get('keyword', '').strip()
+    foods = [food.strip() for food in args.get('foods', '').split(',') if food.strip() != '']
+
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        return 400, {'error': 'limit and offset must be integers.'}
+
+    if keyword == '':
+        return 400, {'error': 'Please enter a keyword.'}
+    if len(foods) == 0:
+        return 400, {'error': 'Please select at least one value.'}
+    if len({food.lower() for food in foods}) != len(foods):
+        return 400, {'error': 'Please select unique values.'}
+    if not 0 < limit <= MAX_LIMIT or offset < 0:
+        return 400, {'error': f'limit must be between 1 and {MAX_LIMIT} and offset must not '
+                              f'be negative.'}
+
+    for food in foods:
+        if food not in graph.get_foods():
+            return 400, {'error': f'Unknown food: {food}'}
+
+    recommendations = recommend(graph, keyword, set(foods), limit, offset, engine, cache,
+                                scorer, warmup)
+
+    return 200, {
+        'graph_version': graph.version,
+        'keyword': keyword,
+        'foods': foods,
+        'limit': limit,
+        'offset': offset,
+        'recommendations': [{'food': food, 'score': score}
+                            for food, score in recommendations.items()]
+    }
+
+
+def create_asgi_app(graph: ComfortFoodGraph,
+                    engine: Optional[Union[SimilarityEngine, SimilarityTable]] = None,
+                    cache: Optional[RecommendationCache] = None,
+                    executor: Optional[Executor] = None,
+                    scorer: Optional[Union[ScoringPipeline, RandomWalkRecommender]] = None) \
+        -> Callable[..., Awaitable[None]]:
+    """Return an ASGI application serving /api/recommendations for graph.
+
+    Requests are handled on the event loop, and the recommendations themselves are computed
+    in `executor` (by default, the event loop's default thread pool), so a slow query never
+    blocks the other connections.
+    """
+    async def app(scope: dict, receive: Callable, send: Callable) -> None:
+        """Handle one ASGI connection."""
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        if scope['type'] != 'http':
+            return
+
+        if scope['path'] != '/api/recommendations':
+            status, body = 404, {'error': 'Not found.'}
+        elif scope['method'] != 'GET':
+            status, body = 405, {'error': 'Method not allowed.'}
+        else:
+            args = dict(parse_qsl(scope['query_string'].decode()))
+            loop = asyncio.get_running_loop()
+            status, body = await loop.run_in_executor(executor, recommendation_response,
+                                                      graph, args, engine, cache, scorer)
+
+        content = json.dumps(body).encode()
+
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(content)).encode())]})
+        await send({'type': 'http.response.body', 'body': content})
+
+    return app
+
+
+def create_default_asgi_app() -> Callable[..., Awaitable[None]]:
+    """Return an ASGI application serving recommendations for the food choices dataset."""
+    food_choices_path = 'data/food_choices_clean.csv'
+
+    # Display error message if the food choices dataset is not found
+    if not os.path.isfile(food_choices_path):
+        raise FileNotFoundError(f'The food choices dataset file: {food_choices_path} was not found')
+
+    comfort_graph = load.load_comfort_food_graph_cached(food_choices_path)
+
+    return create_asgi_app(comfort_graph, SimilarityTable(comfort_graph),
+                           RecommendationCache(maxsize=1024))
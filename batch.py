@@ -0,0 +1,162 @@
+"""
+FoodFinder
+by Kenneth Tran
+
+Compute recommendations for many queries at once, for offline scoring.
+
+Usage: python batch.py QUERIES RESULTS [--limit LIMIT] [--processes PROCESSES]
+
+QUERIES is a JSONL file with one {"keyword": ..., "liked_foods": [...]} query per line.
+RESULTS is the JSONL file to write, with the recommendations of each query on the line of
+the same number.
+"""
+
+import argparse
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Collection, Iterable, Iterator, Optional, TextIO, Union
+
+import load
+import recommendation
+from graph import ComfortFoodGraph
+from similarity import SimilarityEngine, SimilarityTable
+
+# The engine of each worker process, built once by _init_worker
+_worker_engine: Optional[SimilarityEngine] = None
+
+
+def recommend_batch(graph: ComfortFoodGraph, queries: Iterable[tuple[str, set[str]]],
+                    limit: int,
+                    engine: Optional[Union[SimilarityEngine, SimilarityTable]] = None,
+                    processes: int = 1, chunk_size: int = 1000) -> Iterator[Optional[list[str]]]:
+    """Yield the recommendations of every (keyword, liked_foods) query in queries, in order,
+    as recommendation.recommend_comfort_foods would return them.
+
+    Queries are scored `chunk_size` at a time. Within a chunk, the similarity row of each
+    distinct liked food and the foods associated with each distinct keyword are looked up
+    once, so the chunk is scored against one shared sparse similarity matrix. If `processes`
+    is more than 1, the chunks are scored in parallel by that many worker processes.
+
+    Yield None for a query that has a liked food which is not a food in graph.
+    """
+    chunks = _chunks(queries, chunk_size)
+
+    if processes == 1:
+        if engine is None:
+            engine = SimilarityEngine(graph)
+
+        for chunk in chunks:
+            yield from _score_chunk(engine, chunk, limit)
+    else:
+        # Send the liked foods as lists, so that workers visit them in the same order as this
+        # process (which the scores depend on) even though their string hashes differ
+        chunks = ([(keyword, list(liked_foods)) for keyword, liked_foods in chunk]
+                  for chunk in chunks)
+
+        with ProcessPoolExecutor(processes, initializer=_init_worker,
+                                 initargs=(graph,)) as executor:
+            for results in executor.map(_score_worker_chunk, chunks, itertools.repeat(limit)):
+                yield from results
+
+
+def write_batch_jsonl(graph: ComfortFoodGraph, queries_file: TextIO, results_file: TextIO,
+                      limit: int, processes: int = 1) -> float:
+    """Write the recommendations of every query in the JSONL queries_file to results_file as
+    JSONL, and return the number of queries scored per second.
+
+    Every query line is a JSON object with a "keyword" and a list of "liked_foods". Every
+    result line repeats the query with its "recommendations", which is null if a liked food
+    is not a food in graph.
+    """
+    start = time.perf_counter()
+    queries = [json.loads(line) for line in queries_file if line.strip() != '']
+
+    results = recommend_batch(graph, ((query['keyword'], set(query['liked_foods']))
+                                      for query in queries), limit, processes=processes)
+
+    for query, recommendations in zip(queries, results):
+        query['recommendations'] = recommendations
+        results_file.write(json.dumps(query) + '\n')
+
+    elapsed = time.perf_counter() - start
+    return len(queries) / elapsed if elapsed > 0 else 0.0
+
+
+def _chunks(queries: Iterable[tuple[str, set[str]]], chunk_size: int) \
+        -> Iterator[list[tuple[str, set[str]]]]:
+    """Yield lists of at most chunk_size consecutive queries."""
+    queries = iter(queries)
+
+    while True:
+        chunk = list(itertools.islice(queries, chunk_size))
+
+        if len(chunk) == 0:
+            return
+
+        yield chunk
+
+
+def _score_chunk(engine: Union[SimilarityEngine, SimilarityTable],
+                 chunk: list[tuple[str, Collection[str]]], limit: int) \
+        -> list[Optional[list[str]]]:
+    """Return the recommendations of every query in chunk, sharing the similarity rows and
+    keyword lookups between the queries.
+    """
+    graph = engine.graph
+    rows = {}
+    foods_with_reasons = {}
+    results = []
+
+    for keyword, liked_foods in chunk:
+        try:
+            for liked_food in liked_foods:
+                if liked_food not in rows:
+                    rows[liked_food] = engine.similarities(liked_food)
+        except ValueError:
+            results.append(None)
+            continue
+
+        if keyword not in foods_with_reasons:
+            foods_with_reasons[keyword] = recommendation.get_foods_with_reasons(graph, {keyword})
+
+        scores = recommendation.score_from_similarities(
+            graph, liked_foods, {liked_food: rows[liked_food] for liked_food in liked_foods},
+            foods_with_reasons[keyword])
+        results.append(recommendation.select_top(scores, limit))
+
+    return results
+
+
+def _init_worker(graph: ComfortFoodGraph) -> None:
+    """Build the engine of a worker process for graph."""
+    global _worker_engine
+    _worker_engine = SimilarityEngine(graph)
+
+
+def _score_worker_chunk(chunk: list[tuple[str, list[str]]], limit: int) \
+        -> list[Optional[list[str]]]:
+    """Return the recommendations of every query in chunk, in a worker process."""
+    return _score_chunk(_worker_engine, chunk, limit)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute recommendations for many queries.')
+    parser.add_argument('queries', help='JSONL file of queries')
+    parser.add_argument('results', help='JSONL file to write the results to')
+    parser.add_argument('--limit', type=int, default=5,
+                        help='number of recommendations per query')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='number of worker processes')
+    parser.add_argument('--dataset', default='data/food_choices_clean.csv',
+                        help='food choices dataset file')
+    args = parser.parse_args()
+
+    comfort_graph = load.load_comfort_food_graph_cached(args.dataset)
+
+    with open(args.queries) as queries_file, open(args.results, 'w') as results_file:
+        throughput = write_batch_jsonl(comfort_graph, queries_file, results_file, args.limit,
+                                       args.processes)
+
+    print(f'Scored queries at {throughput:.1f} queries per second')
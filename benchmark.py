@@ -0,0 +1,231 @@
+"""
+FoodFinder
+by Kenneth Tran
+
+Benchmark the graph, the loader and the recommender on synthetic survey data.
+
+Usage: python benchmark.py [--users USERS] [--foods FOODS] [--reasons REASONS] [--skew SKEW]
+                           [--output OUTPUT] [--baseline BASELINE]
+
+Writes a dataset in the schema of data/food_choices_clean.csv with the given scale, times
+every benchmark on it, and saves the time and peak memory of each benchmark as JSON to
+OUTPUT. If BASELINE is the JSON output of an earlier run, the change in time of every
+benchmark since that run is printed as well.
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Optional, Union
+
+import load
+import recommendation
+from graph import ComfortFoodGraph
+from similarity import SimilarityEngine
+from warmup import WarmupTable
+
+
+def generate_dataset(filename: str, users: int, foods: int, reasons: int,
+                     foods_per_user: int = 3, reasons_per_user: int = 2, skew: float = 1.0,
+                     seed: int = 0) -> None:
+    """Write a synthetic dataset of `users` survey respondents to filename, in the schema of
+    the Food choices dataset (cleaned).
+
+    Every respondent likes between 1 and 2 * foods_per_user - 1 of `foods` foods, for between
+    1 and 2 * reasons_per_user - 1 of `reasons` reasons. The popularity of foods and reasons
+    follows a Zipf distribution with exponent `skew`: the food of rank k is liked about
+    k ** skew times less often than the most popular one (0 makes every food equally
+    popular).
+    """
+    rng = random.Random(seed)
+
+    food_names = [f'Food {i}' for i in range(foods)]
+    reason_names = [f'Reason {i}' for i in range(reasons)]
+    food_weights = [1 / (rank + 1) ** skew for rank in range(foods)]
+    reason_weights = [1 / (rank + 1) ** skew for rank in range(reasons)]
+
+    with open(filename, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['comfort_food', 'comfort_food_reasons'])
+
+        for _ in range(users):
+            user_foods = _sample(rng, food_names, food_weights,
+                                 rng.randint(1, 2 * foods_per_user - 1))
+            user_reasons = _sample(rng, reason_names, reason_weights,
+                                   rng.randint(1, 2 * reasons_per_user - 1))
+            writer.writerow([', '.join(user_foods), ', '.join(user_reasons)])
+
+
+def _sample(rng: random.Random, population: list[str], weights: list[float],
+            k: int) -> list[str]:
+    """Return min(k, len(population)) distinct values of population, drawn with the given
+    weights.
+    """
+    k = min(k, len(population))
+    sample = {}
+
+    while len(sample) < k:
+        sample.update(dict.fromkeys(rng.choices(population, weights, k=k - len(sample))))
+
+    return list(sample)
+
+
+def measure(name: str, function: Callable[[], Any], repeat: int = 3,
+            operations: int = 1) -> dict[str, Any]:
+    """Return the timing and the peak memory of calling function, which performs
+    `operations` operations of the benchmark with the given name.
+
+    The function is timed `repeat` times, and then called once more while tracing memory
+    allocations, which slows it down too much to time it at the same time. A benchmark that
+    needs a dependency which is not installed is reported as skipped.
+    """
+    try:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        try:
+            function()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    except ImportError as error:
+        return {'name': name, 'skipped': str(error)}
+
+    return {
+        'name': name,
+        'operations': operations,
+        'best_seconds': min(times) / operations,
+        'mean_seconds': sum(times) / len(times) / operations,
+        'peak_bytes': peak
+    }
+
+
+def run_benchmarks(dataset: str, queries: int = 100, repeat: int = 3,
+                   seed: int = 0) -> list[dict[str, Any]]:
+    """Return the results of every benchmark on the dataset file.
+
+    The recommendation benchmarks answer `queries` random queries of one to three liked
+    foods each; their times are per query.
+    """
+    rng = random.Random(seed)
+    results = [measure('load_comfort_food_graph',
+                       lambda: load.load_comfort_food_graph(dataset), repeat)]
+
+    graph = load.load_comfort_food_graph(dataset)
+    foods = list(graph.get_foods())
+    reasons = list(graph.get_all_reasons())
+    query_list = [(rng.choice(reasons), set(rng.sample(foods, min(len(foods),
+                                                                   rng.randint(1, 3)))))
+                  for _ in range(queries)]
+    engine = SimilarityEngine(graph)
+    warmup_table = WarmupTable(graph)
+
+    def recommend_all(query_engine: Optional[Union[SimilarityEngine, WarmupTable]] = None) \
+            -> None:
+        """Answer every query."""
+        for keyword, liked_foods in query_list:
+            recommendation.recommend_comfort_foods(graph, keyword, liked_foods, 5, query_engine)
+
+    recommended = recommendation.recommend_comfort_foods(graph, *query_list[0], 5, engine)
+    subgraph = graph.create_subgraph(recommended)
+
+    results.extend([
+        measure('get_all_reasons', graph.get_all_reasons, repeat),
+        measure('recommend_comfort_foods', recommend_all, repeat, queries),
+        measure('recommend_comfort_foods (engine)', lambda: recommend_all(engine), repeat,
+                queries),
+        measure('warm-up table', lambda: WarmupTable(graph), repeat),
+        measure('recommend_comfort_foods (warm-up table)', lambda: recommend_all(warmup_table),
+                repeat, queries),
+        measure('create_subgraph', lambda: graph.create_subgraph(recommended), repeat),
+        measure('to_networkx', graph.to_networkx, repeat),
+        measure('visualization traces', lambda: _build_figure(subgraph), repeat)
+    ])
+
+    return results
+
+
+def _build_figure(graph: ComfortFoodGraph) -> None:
+    """Build the plotly figure of graph. Visualization is imported here, since plotly and
+    numpy are only needed for this benchmark.
+    """
+    import visualization
+    visualization.create_comfort_food_figure(graph)
+
+
+def compare(results: list[dict[str, Any]], baseline: list[dict[str, Any]]) -> list[str]:
+    """Return a line describing the change in best time of every benchmark in results that
+    was also run in baseline.
+
+    >>> compare([{'name': 'load', 'best_seconds': 0.5}], [{'name': 'load', 'best_seconds': 1.0}])
+    ['load: 1000.000 ms -> 500.000 ms (0.50x)']
+    """
+    baseline_times = {result['name']: result['best_seconds'] for result in baseline
+                      if 'best_seconds' in result}
+    lines = []
+
+    for result in results:
+        if 'best_seconds' in result and result['name'] in baseline_times:
+            old, new = baseline_times[result['name']], result['best_seconds']
+            ratio = new / old if old > 0 else float('inf')
+            lines.append(f'{result["name"]}: {old * 1000:.3f} ms -> {new * 1000:.3f} ms '
+                         f'({ratio:.2f}x)')
+
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark FoodFinder on synthetic data.')
+    parser.add_argument('--users', type=int, default=10000, help='number of respondents')
+    parser.add_argument('--foods', type=int, default=500, help='number of distinct foods')
+    parser.add_argument('--reasons', type=int, default=20, help='number of distinct reasons')
+    parser.add_argument('--foods-per-user', type=int, default=3,
+                        help='average number of foods per respondent')
+    parser.add_argument('--reasons-per-user', type=int, default=2,
+                        help='average number of reasons per respondent')
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='Zipf exponent of the popularity of foods and reasons')
+    parser.add_argument('--queries', type=int, default=100,
+                        help='number of queries for the recommendation benchmarks')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file of results')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare to')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        dataset_path = os.path.join(directory, 'food_choices.csv')
+        generate_dataset(dataset_path, args.users, args.foods, args.reasons,
+                         args.foods_per_user, args.reasons_per_user, args.skew, args.seed)
+        benchmark_results = run_benchmarks(dataset_path, args.queries, args.repeat, args.seed)
+
+    with open(args.output, 'w') as output_file:
+        json.dump({
+            'parameters': vars(args),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'results': benchmark_results
+        }, output_file, indent=2)
+
+    for benchmark_result in benchmark_results:
+        if 'skipped' in benchmark_result:
+            print(f'{benchmark_result["name"]}: skipped ({benchmark_result["skipped"]})')
+        else:
+            print(f'{benchmark_result["name"]}: {benchmark_result["best_seconds"] * 1000:.3f} '
+                  f'ms, peak {benchmark_result["peak_bytes"] / 1024:.0f} KiB')
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            print('\nChange since the baseline:')
+            print('\n'.join(compare(benchmark_results, json.load(baseline_file)['results'])))
@@ -0,0 +1,128 @@
+"""
+FoodFinder
+by Kenneth Tran
+
+Cache recommendations for repeated queries.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from graph import ComfortFoodGraph
+
+
+class PartialScores(dict):
+    """Recommendation scores that were cut short before they were complete, for example by
+    a time budget, and so are never cached by a RecommendationCache.
+    """
+
+
+class RecommendationCache:
+    """A bounded cache of recommendation scores with least-recently-used eviction.
+
+    Queries are keyed on the keyword and on the set of liked foods, ignoring their order.
+    The scores of a query are cached rather than a single page of
+    recommendations, so that every page of the query can be selected from them. Every entry
+    is dropped once the graph changes (graph versions only ever increase, so lookups on an
+    older version of the graph are computed without the cache), and entries older than `ttl`
+    seconds are recomputed. Scores computed as PartialScores are returned without being
+    cached.
+    The cache can be shared between request threads.
+
+    Instance Attributes:
+        - maxsize: The maximum number of entries in this cache
+        - ttl: The number of seconds an entry stays valid, or None if entries never expire
+        - hits: The number of lookups answered from this cache
+        - misses: The number of lookups that had to compute their scores
+    """
+    maxsize: int
+    ttl: Optional[float]
+    hits: int
+    misses: int
+
+    # Private Instance Attributes:
+    #   - _entries: Maps each key to the time its entry was stored and its recommendation
+    #       scores, from least to most recently used
+    #   - _version: The version of the graph the entries were computed from
+    #   - _lock: The lock guarding the entries and counters
+    _entries: OrderedDict[Hashable, tuple[float, dict[str, float]]]
+    _version: Optional[int]
+    _lock: threading.Lock
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None) -> None:
+        """Initialize an empty cache holding at most maxsize entries."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of entries in this cache."""
+        return len(self._entries)
+
+    def lookup(self, graph: ComfortFoodGraph, keyword: str, liked_foods: set[str],
+               compute: Callable[[], dict[str, float]]) -> dict[str, float]:
+        """Return the cached recommendation scores for the given query on graph, calling
+        compute to get them (and caching the result) if they are not cached yet.
+
+        The returned scores are shared with this cache and must not be changed.
+        """
+        key = make_key(keyword, liked_foods)
+
+        with self._lock:
+            if self._version is None or graph.version > self._version:
+                self._entries.clear()
+                self._version = graph.version
+
+            # A request still reading an older snapshot of the graph bypasses this cache
+            entry = self._entries.get(key) if graph.version == self._version else None
+
+            if entry is not None and (self.ttl is None or
+                                      time.monotonic() - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            version = self._version
+
+        # Compute outside of the lock so that other queries are not blocked
+        scores = compute()
+
+        # Scores that were cut short could be better next time, so they are not kept
+        if isinstance(scores, PartialScores):
+            return scores
+
+        with self._lock:
+            if self._version == version == graph.version:
+                self._entries[key] = (time.monotonic(), scores)
+                self._entries.move_to_end(key)
+
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+        return scores
+
+    def clear(self) -> None:
+        """Remove every entry from this cache."""
+        with self._lock:
+            self._entries.clear()
+
+
+def make_key(keyword: str, liked_foods: set[str]) -> Hashable:
+    """Return the cache key of a query, which does not depend on the order of the liked
+    foods.
+
+    Foods are looked up in the graph case-sensitively, so the key is too.
+
+    >>> make_key('Stress', {'Pizza', 'Tea'}) == make_key('Stress', {'Tea', 'Pizza'})
+    True
+    >>> make_key('Stress', {'Pizza'}) == make_key('Stress', {'PIZZA'})
+    False
+    """
+    return keyword, frozenset(liked_foods)
@@ -6,62 +6,970 @@ Defines the relevant graph class.
 """
 
 from __future__ import annotations
-from typing import Any
+import bisect
+import itertools
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import Any, Callable, Iterable, Iterator, KeysView, NamedTuple, Optional, Sequence, \
+    Union, TYPE_CHECKING
 
-import networkx as nx
+import metrics
+
+if TYPE_CHECKING:
+    import networkx as nx
 
 
 class _ComfortFoodVertex:
-    """A weighted vertex in a ComfortFoodGraph.
+    """A vertex in a ComfortFoodGraph.
+
+    The edges of a vertex are stored by the graph, indexed by the id of the vertex.
 
     Instance Attributes:
         - value: The value (or name) of this vertex
         - vertex_type: The type of this vertex
-        - neighbours: The vertices adjacent to this vertex with weights
+        - id: The dense integer id of this vertex in its graph
     """
+    __slots__ = ('value', 'vertex_type', 'id')
     value: str
     vertex_type: str
-    neighbours: dict[_ComfortFoodVertex, list[str]]
+    id: int
 
-    def __init__(self, value: Any, vertex_type: str) -> None:
-        """Initialize a new vertex with the given item and type."""
+    def __init__(self, value: Any, vertex_type: str, vertex_id: int) -> None:
+        """Initialize a new vertex with the given item, type and id."""
         self.value = value
         self.vertex_type = vertex_type
-        self.neighbours = {}
+        self.id = vertex_id
+
+
+class UserBlock(NamedTuple):
+    """A block of users and the edges between them and their foods, in CSR form over ids
+    local to the block, so that it can be built without a graph (for example, in another
+    process) and then added to a graph with ComfortFoodGraph.add_user_block.
+
+    User i of the block likes the foods with the local ids in
+    food_ids[food_indptr[i]:food_indptr[i + 1]], for the reasons in masks[user_masks[i]]. It
+    is the first user of the block to like the foods with local ids from new_food_indptr[i]
+    up to (but not including) new_food_indptr[i + 1]. Food j of the block is liked by the
+    users in user_ids[user_indptr[j]:user_indptr[j + 1]], in increasing order. The foods and
+    the users with reason k are listed the same way by reason_food_indptr, reason_food_ids,
+    reason_user_indptr and reason_user_ids.
+
+    Instance Attributes:
+        - foods: The foods of the block, by local id, in the order they first appear
+        - reasons: The reasons of the block, by local id, in the order they first appear
+        - masks: The distinct sets of reasons of the users, as increasing local reason ids
+    """
+    foods: list[str]
+    reasons: list[str]
+    masks: list[tuple[int, ...]]
+    user_masks: array
+    new_food_indptr: array
+    food_indptr: array
+    food_ids: array
+    user_indptr: array
+    user_ids: array
+    reason_food_indptr: array
+    reason_food_ids: array
+    reason_user_indptr: array
+    reason_user_ids: array
+
+
+# The magic number and format version of graph snapshot files
+_SNAPSHOT_MAGIC = b'FFGRAPH\0'
+_SNAPSHOT_VERSION = 1
+
+# Compact the pending edges into the CSR arrays once there are more pending adjacency entries
+# than this fraction of the compacted ones (or than _COMPACT_MIN_PENDING, if larger)
+_COMPACT_RATIO = 0.25
+_COMPACT_MIN_PENDING = 4096
+
+
+def _align(length: int) -> int:
+    """Return length rounded up to the next multiple of 8."""
+    return (length + 7) // 8 * 8
 
 
 class ComfortFoodGraph:
     """A bipartite graph with two disjoint sets: one with users that were surveyed, and one
     representing a food item.
+
+    Vertices are numbered with dense integer ids. The adjacency lists are stored in CSR form
+    (a row of sorted neighbour ids per vertex), and the reasons of each edge are stored as
+    the id of a bitmask over the vocabulary of reasons in this graph. Edges added after the
+    last compaction are kept in a small pending table until compact is called, which happens
+    automatically once the pending table grows large enough.
     """
+    # Private Instance Attributes:
+    #   - _vertices: Maps each value to its vertex in this graph
+    #   - _vertices_by_id: The vertex with each id
+    #   - _partitions: Maps each vertex type to the vertices of that type, in insertion order
+    #   - _version: The number of changes made to this graph so far
+    #   - _indptr: The row offsets of the compacted adjacency lists; vertices with an id of at
+    #       least len(_indptr) - 1 were added after the last compaction and have no row
+    #   - _indices: The neighbour ids of every compacted row, sorted within each row
+    #   - _edge_masks: The reason mask id of each entry of _indices
+    #       (_indptr, _indices and _edge_masks are memoryviews over the file for a graph
+    #       loaded from a snapshot, until the next compaction)
+    #   - _pending: Maps vertex ids to the neighbour ids and reason mask ids of their edges
+    #       that were added after the last compaction
+    #   - _num_pending: The number of adjacency entries in _pending
+    #   - _reason_ids: Maps each reason in the vocabulary to its bit in the reason masks
+    #   - _reason_names: The reason for each bit of the reason masks
+    #   - _masks: The distinct reason masks in this graph, indexed by mask id
+    #   - _mask_ids: Maps each reason mask to its mask id
+    #   - _mask_reasons: The reasons for each mask id, in vocabulary order
+    #   - _reasons: The set of all (interned) reasons in this graph
+    #   - _reason_foods: Maps each reason to the foods with at least one edge with that reason
+    #   - _reason_users: Maps each reason to the users with at least one edge with that reason
+    #   - _edge_listeners: The functions to call with (user, food) whenever a new edge is added
     _vertices: dict[str, _ComfortFoodVertex]
+    _vertices_by_id: list[_ComfortFoodVertex]
+    _partitions: dict[str, dict[str, _ComfortFoodVertex]]
+    _version: int
+    _indptr: Union[array, memoryview]
+    _indices: Union[array, memoryview]
+    _edge_masks: Union[array, memoryview]
+    _pending: dict[int, dict[int, int]]
+    _num_pending: int
+    _reason_ids: dict[str, int]
+    _reason_names: list[str]
+    _masks: list[int]
+    _mask_ids: dict[int, int]
+    _mask_reasons: list[tuple[str, ...]]
+    _reasons: set[str]
+    _reason_foods: dict[str, set[str]]
+    _reason_users: dict[str, set[str]]
+    _edge_listeners: list[Callable[[str, str], None]]
 
     def __init__(self) -> None:
         self._vertices = {}
+        self._vertices_by_id = []
+        self._partitions = {'user': {}, 'food': {}}
+        self._version = 0
+        self._indptr = array('q', [0])
+        self._indices = array('q')
+        self._edge_masks = array('q')
+        self._pending = {}
+        self._num_pending = 0
+        self._reason_ids = {}
+        self._reason_names = []
+        self._masks = []
+        self._mask_ids = {}
+        self._mask_reasons = []
+        self._reasons = set()
+        self._reason_foods = {}
+        self._reason_users = {}
+        self._edge_listeners = []
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Return the state of this graph to pickle, for example to send it to another
+        process. Memory-mapped arrays are copied and edge listeners are left out.
+
+        >>> import os, pickle, tempfile
+        >>> graph = ComfortFoodGraph()
+        >>> graph.add_vertex('User #0', 'user')
+        >>> graph.add_vertex('Pizza', 'food')
+        >>> graph.add_edge('User #0', 'Pizza', ['Stress'])
+        >>> directory = tempfile.TemporaryDirectory()
+        >>> filename = os.path.join(directory.name, 'graph.snapshot')
+        >>> graph.save_snapshot(filename)
+        >>> loaded = pickle.loads(pickle.dumps(ComfortFoodGraph.load_snapshot(filename)))
+        >>> loaded.get_reasons('User #0', 'Pizza'), type(loaded._indices).__name__
+        (['Stress'], 'array')
+        >>> directory.cleanup()
+        """
+        state = self.__dict__.copy()
+
+        for name in ('_indptr', '_indices', '_edge_masks'):
+            if isinstance(state[name], memoryview):
+                state[name] = array('q')
+                state[name].frombytes(getattr(self, name).cast('B'))
+
+        state['_edge_listeners'] = []
+
+        return state
+
+    def copy(self) -> ComfortFoodGraph:
+        """Return a copy of this graph that can be changed without changing this graph, with
+        the same version and without any edge listeners.
+
+        The compacted neighbour ids are never changed in place, so the copy shares them with
+        this graph; everything else is copied.
+        """
+        graph = ComfortFoodGraph.__new__(ComfortFoodGraph)
+        graph.__dict__.update(self.__dict__)
+
+        graph._vertices = self._vertices.copy()
+        graph._vertices_by_id = self._vertices_by_id.copy()
+        graph._partitions = {vertex_type: vertices.copy()
+                             for vertex_type, vertices in self._partitions.items()}
+        graph._edge_masks = array('q')
+        graph._edge_masks.frombytes(self._edge_masks.tobytes())
+        graph._pending = {vertex_id: row.copy() for vertex_id, row in self._pending.items()}
+        graph._reason_ids = self._reason_ids.copy()
+        graph._reason_names = self._reason_names.copy()
+        graph._masks = self._masks.copy()
+        graph._mask_ids = self._mask_ids.copy()
+        graph._mask_reasons = self._mask_reasons.copy()
+        graph._reasons = self._reasons.copy()
+        graph._reason_foods = {reason: foods.copy()
+                               for reason, foods in self._reason_foods.items()}
+        graph._reason_users = {reason: users.copy()
+                               for reason, users in self._reason_users.items()}
+        graph._edge_listeners = []
+
+        return graph
 
     def add_vertex(self, value: str, vertex_type: str) -> None:
         """Add a vertex with the given value and type. Does nothing if the vertex is already in
         this graph.
         """
         if value not in self._vertices:
-            self._vertices[value] = _ComfortFoodVertex(value, vertex_type)
+            vertex_type = sys.intern(vertex_type)
+            vertex = _ComfortFoodVertex(value, vertex_type, len(self._vertices_by_id))
+            self._vertices[value] = vertex
+            self._vertices_by_id.append(vertex)
+            self._partitions.setdefault(vertex_type, {})[value] = vertex
+            self._version += 1
+
+    @property
+    def version(self) -> int:
+        """The number of changes made to this graph so far.
+
+        The version increases every time a vertex or an edge is added, so results derived
+        from this graph can be cached for as long as the version stays the same.
+        """
+        return self._version
+
+    def add_vertices(self, values: Iterable[str], vertex_type: str) -> None:
+        """Add a vertex with the given type for every value in values. Values that are
+        already vertices in this graph are skipped.
+        """
+        for value in values:
+            self.add_vertex(value, vertex_type)
 
     def add_edge(self, user: str, food: str, reasons: list[str]) -> None:
         """Add an edge between user and food with a list of reasons.
 
+        If user and food are already adjacent, the reasons of their edge are replaced, and
+        reasons that no other edge of user or food has are removed from the reason indexes.
+
+        The user and the food may be given in either order.
+
         Raise a ValueError if either user or food are not vertices in this graph, or if
         user and food are the same vertex type.
+
+        >>> graph = ComfortFoodGraph()
+        >>> graph.add_vertex('User #0', 'user')
+        >>> graph.add_vertices(['Pizza', 'Chips'], 'food')
+        >>> graph.add_edge('User #0', 'Pizza', ['Stress', 'Boredom'])
+        >>> graph.add_edge('User #0', 'Chips', ['Boredom'])
+        >>> graph.add_edge('User #0', 'Pizza', ['Stress'])
+        >>> graph.get_reasons('User #0', 'Pizza')
+        ['Stress']
+        >>> graph.get_foods_with_reason('Boredom')
+        {'Chips'}
+        >>> graph.get_users_with_reason('Boredom')
+        {'User #0'}
+        >>> graph.add_edge('User #0', 'Chips', ['Stress'])
+        >>> graph.get_all_reasons()
+        {'Stress'}
+        >>> sorted(graph.get_foods_with_reason('Stress'))
+        ['Chips', 'Pizza']
+        >>> graph.add_vertex('User #1', 'user')
+        >>> graph.add_edge('Pizza', 'User #1', ['Hunger'])
+        >>> graph.get_foods_with_reason('Hunger'), graph.get_users_with_reason('Hunger')
+        ({'Pizza'}, {'User #1'})
         """
         if user not in self._vertices or food not in self._vertices or \
                 self._vertices[user].vertex_type == self._vertices[food].vertex_type:
             raise ValueError
         else:
             # Add the edge between the two vertices
-            v1 = self._vertices[user]
-            v2 = self._vertices[food]
+            v1, v2 = self._user_first(self._vertices[user], self._vertices[food])
+            self._insert_edge(v1, v2, self._intern_mask(reasons))
+            self._compact_if_needed()
+
+    @metrics.timed('graph.add_edges')
+    def add_edges(self, edges: Iterable[tuple[str, str, list[str]]]) -> None:
+        """Add every (user, food, reasons) edge in edges, as add_edge would, so the user and
+        the food of each edge may be given in either order.
+
+        Consecutive edges that share the same reasons list object only have their reasons
+        interned once, and the pending edges are compacted at most once at the end. A new
+        edge of a vertex added since the last compaction, which has no compacted row to
+        search, is appended straight to the pending table, and the reason indexes are
+        updated for all such edges at once, by distinct reasons rather than by edge.
+
+        Raise a ValueError, without adding any edge, if any edge is between vertices that
+        are not in this graph or that are the same vertex type.
+        """
+        vertices = self._vertices
+        vertex_edges = []
+
+        for user, food, reasons in edges:
+            if user not in vertices or food not in vertices or \
+                    vertices[user].vertex_type == vertices[food].vertex_type:
+                raise ValueError
+
+            vertex_edges.append((*self._user_first(vertices[user], vertices[food]), reasons))
+
+        pending = self._pending
+        num_rows = len(self._indptr) - 1
+        unindexed = {}
+        new_edges = []
+        last_reasons, mask_id, users, foods = None, None, None, None
+
+        for v1, v2, reasons in vertex_edges:
+            if reasons is not last_reasons:
+                last_reasons, mask_id = reasons, self._intern_mask(reasons)
+                users, foods = unindexed.setdefault(mask_id, (set(), set()))
+
+            if (v1.id >= num_rows or v2.id >= num_rows) and v2.id not in pending.get(v1.id, ()):
+                pending.setdefault(v1.id, {})[v2.id] = mask_id
+                pending.setdefault(v2.id, {})[v1.id] = mask_id
+                self._num_pending += 2
+                users.add(v1.value)
+                foods.add(v2.value)
+                new_edges.append((v1.value, v2.value))
+
+                # Listeners see the graph as it is right after each edge, as with add_edge
+                if len(self._edge_listeners) > 0:
+                    self._index_new_edges(unindexed, new_edges)
+                    users, foods = unindexed.setdefault(mask_id, (set(), set()))
+            else:
+                # Replacing the reasons of an edge needs the indexes of the edges before it
+                self._index_new_edges(unindexed, new_edges)
+                self._insert_edge(v1, v2, mask_id)
+                users, foods = unindexed.setdefault(mask_id, (set(), set()))
+
+        self._index_new_edges(unindexed, new_edges)
+
+        metrics.count('graph_edges_added', len(vertex_edges))
+        self._compact_if_needed()
+
+    @metrics.timed('graph.add_users')
+    def add_users(self, users: Iterable[tuple[str, list[str], list[str]]]) -> None:
+        """Add a user vertex for every (user, foods, reasons) triple in users, with an edge
+        with the given reasons between the user and each of the foods, adding the foods that
+        are not vertices in this graph yet, as add_vertex, add_vertices and add_edges would.
+
+        The row of a user that is not in this graph yet is written straight to the pending
+        table, and the reason indexes are updated once for all the users with the same
+        reasons rather than once per edge.
+
+        Raise a ValueError if any of the foods is a user vertex; the users before it and its
+        vertices are still added, but none of its edges.
+
+        >>> graph = ComfortFoodGraph()
+        >>> graph.add_users([('User #0', ['Pizza', 'Chips'], ['Stress']),
+        ...                  ('User #1', ['Pizza'], ['Boredom'])])
+        >>> sorted(graph.get_neighbours('Pizza')), graph.get_reasons('User #1', 'Pizza')
+        (['User #0', 'User #1'], ['Boredom'])
+        >>> sorted(graph.get_foods_with_reason('Stress')), graph.get_users_with_reason('Boredom')
+        (['Chips', 'Pizza'], {'User #1'})
+
+        New users still get their edges after an existing user's edges compact the graph:
+
+        >>> graph.add_users((f'User #{i}', ['Pizza'], []) for i in
+        ...                 range(2, _COMPACT_MIN_PENDING // 2 - 1))
+        >>> graph.add_users([('User #0', ['Fries', 'Salad'], ['Stress']),
+        ...                  ('User #new', ['Chips', 'Fries'], ['Boredom'])])
+        >>> graph._num_pending, sorted(graph.get_neighbours('User #new'))
+        (4, ['Chips', 'Fries'])
+        >>> sorted(graph.get_neighbours('Fries')), graph.get_reasons('User #new', 'Chips')
+        (['User #0', 'User #new'], ['Boredom'])
+        """
+        vertices = self._vertices
+        vertices_by_id = self._vertices_by_id
+        user_partition = self._partitions['user']
+        unindexed = {}
+        num_edges = 0
+
+        # The mask ids of the reasons lists seen so far, since respondents mostly share a few
+        # combinations of reasons
+        mask_ids = {}
+
+        for user, foods, reasons in users:
+            if user in vertices or len(self._edge_listeners) > 0:
+                self._index_reason_masks(unindexed)
+                self.add_vertex(user, 'user')
+                self.add_vertices(foods, 'food')
+                self.add_edges((user, food, reasons) for food in foods)
+                continue
+
+            # Add the user vertex as add_vertex would
+            user_id = len(vertices_by_id)
+            vertex = _ComfortFoodVertex(user, 'user', user_id)
+            vertices[user] = vertex
+            vertices_by_id.append(vertex)
+            user_partition[user] = vertex
+            food_ids = []
+
+            for food in foods:
+                food_vertex = vertices.get(food)
+
+                if food_vertex is None:
+                    self.add_vertex(food, 'food')
+                    food_vertex = vertices[food]
+                elif food_vertex.vertex_type == 'user':
+                    self._version += 1
+                    self._index_reason_masks(unindexed)
+                    raise ValueError
+
+                food_ids.append(food_vertex.id)
+
+            reasons_key = tuple(reasons)
+            mask_id = mask_ids.get(reasons_key)
+
+            if mask_id is None:
+                mask_id = mask_ids[reasons_key] = self._intern_mask(reasons)
+
+            # The user is new, so none of these edges can be in the compacted rows. The
+            # pending table is looked up again since adding edges above may have compacted it
+            pending = self._pending
+            row = pending[user_id] = dict.fromkeys(food_ids, mask_id)
+
+            for food_id in row:
+                if food_id in pending:
+                    pending[food_id][user_id] = mask_id
+                else:
+                    pending[food_id] = {user_id: mask_id}
+
+            if mask_id in unindexed:
+                mask_users, mask_foods = unindexed[mask_id]
+                mask_users.add(user)
+                mask_foods.update(foods)
+            else:
+                unindexed[mask_id] = ({user}, set(foods))
+
+            self._num_pending += 2 * len(row)
+            self._version += 1 + len(row)
+            num_edges += len(row)
+
+        self._index_reason_masks(unindexed)
+
+        metrics.count('graph_edges_added', num_edges)
+        self._compact_if_needed()
+
+    @metrics.timed('graph.add_user_block')
+    def add_user_block(self, users: list[str], block: UserBlock) -> None:
+        """Add the users of block, with the given values, and their foods and edges, as
+        add_users would.
+
+        Only the vertices are added one at a time: the rows and the reason indexes of the
+        block are remapped from local ids to the ids of this graph and written to the pending
+        table in bulk.
+
+        Raise a ValueError, without changing this graph, if users and block have a different
+        number of users, or if any food of the block is a user vertex in this graph.
+        """
+        vertices = self._vertices
+        foods = block.foods
+
+        if len(users) != len(block.user_masks) or \
+                any(vertices[food].vertex_type == 'user' for food in foods if food in vertices):
+            raise ValueError
+
+        if len(self._edge_listeners) > 0 or not vertices.keys().isdisjoint(users) or \
+                not set(users).isdisjoint(foods):
+            self.add_users((user,
+                            [foods[j] for j in
+                             block.food_ids[block.food_indptr[i]:block.food_indptr[i + 1]]],
+                            [block.reasons[k] for k in block.masks[block.user_masks[i]]])
+                           for i, user in enumerate(users))
+            return
+
+        # Add the vertices in the order add_users would, mapping local ids to graph ids
+        user_ids = []
+        food_ids = []
+
+        for i, user in enumerate(users):
+            self.add_vertex(user, 'user')
+            user_ids.append(vertices[user].id)
+
+            for j in range(block.new_food_indptr[i], block.new_food_indptr[i + 1]):
+                self.add_vertex(foods[j], 'food')
+                food_ids.append(vertices[foods[j]].id)
+
+        mask_ids = [self._intern_mask([block.reasons[k] for k in mask]) for mask in block.masks]
+        user_mask_ids = list(map(mask_ids.__getitem__, block.user_masks))
+
+        # The users are new, so none of these edges can be in the compacted rows
+        pending = self._pending
+
+        for i, user_id in enumerate(user_ids):
+            row = block.food_ids[block.food_indptr[i]:block.food_indptr[i + 1]]
+            pending[user_id] = dict.fromkeys(map(food_ids.__getitem__, row), user_mask_ids[i])
+
+        for j, food_id in enumerate(food_ids):
+            row = block.user_ids[block.user_indptr[j]:block.user_indptr[j + 1]]
+            entries = zip(map(user_ids.__getitem__, row), map(user_mask_ids.__getitem__, row))
+
+            if food_id in pending:
+                pending[food_id].update(entries)
+            else:
+                pending[food_id] = dict(entries)
+
+        for k, reason in enumerate(block.reasons):
+            reason = sys.intern(reason)
+            reason_foods = block.reason_food_ids[block.reason_food_indptr[k]:
+                                                 block.reason_food_indptr[k + 1]]
+            reason_users = block.reason_user_ids[block.reason_user_indptr[k]:
+                                                 block.reason_user_indptr[k + 1]]
+
+            if len(reason_foods) > 0:
+                self._reasons.add(reason)
+                self._reason_foods.setdefault(reason, set()).update(map(foods.__getitem__,
+                                                                        reason_foods))
+                self._reason_users.setdefault(reason, set()).update(map(users.__getitem__,
+                                                                        reason_users))
+
+        num_edges = len(block.food_ids)
+        self._num_pending += 2 * num_edges
+        self._version += num_edges
+
+        metrics.count('graph_edges_added', num_edges)
+        self._compact_if_needed()
+
+    def _index_new_edges(self, unindexed: dict[int, tuple[set[str], set[str]]],
+                         new_edges: list[tuple[str, str]]) -> None:
+        """Update the reason indexes and the version for the given new edges, which are
+        already stored, and call the edge listeners with each of them. Then clear both
+        arguments.
+
+        `unindexed` maps each reason mask id to the users and the foods of the new edges with
+        that reason mask, and `new_edges` holds the (user, food) pair of every new edge.
+        """
+        self._index_reason_masks(unindexed)
+        self._version += len(new_edges)
+
+        for user, food in new_edges:
+            for listener in self._edge_listeners:
+                listener(user, food)
+
+        new_edges.clear()
+
+    def _index_reason_masks(self, unindexed: dict[int, tuple[set[str], set[str]]]) -> None:
+        """Add the users and the foods of new edges to the reason indexes, where unindexed
+        maps each reason mask id to the users and the foods of the new edges with that reason
+        mask. Then clear unindexed.
+        """
+        for mask_id, (users, foods) in unindexed.items():
+            for reason in self._mask_reasons[mask_id]:
+                self._reasons.add(reason)
+                self._reason_foods.setdefault(reason, set()).update(foods)
+                self._reason_users.setdefault(reason, set()).update(users)
+
+        unindexed.clear()
+
+    @staticmethod
+    def _user_first(v1: _ComfortFoodVertex, v2: _ComfortFoodVertex) \
+            -> tuple[_ComfortFoodVertex, _ComfortFoodVertex]:
+        """Return v1 and v2, the user vertex first and the food vertex second."""
+        if v1.vertex_type == 'user':
+            return v1, v2
+        else:
+            return v2, v1
+
+    def _insert_edge(self, v1: _ComfortFoodVertex, v2: _ComfortFoodVertex,
+                     mask_id: int) -> None:
+        """Add or replace the edge between the user vertex v1 and the food vertex v2 with
+        the given reason mask id, and update the reason indexes.
+        """
+        old_mask_id = self._get_mask_id(v1.id, v2.id)
+
+        self._set_mask_id(v1.id, v2.id, mask_id)
+
+        if old_mask_id is not None:
+            self._unindex_reasons(v1, v2, self._mask_reasons[old_mask_id])
+        self._index_reasons(v1.value, v2.value, self._mask_reasons[mask_id])
+
+        self._version += 1
+
+        if old_mask_id is None:
+            for listener in self._edge_listeners:
+                listener(v1.value, v2.value)
+
+    def add_edge_listener(self, listener: Callable[[str, str], None]) -> None:
+        """Call listener with the user and the food of every new edge added to this graph
+        from now on, right after the edge is added.
+
+        Listeners are not called when the reasons of an existing edge are replaced.
+        """
+        self._edge_listeners.append(listener)
+
+    def _compact_if_needed(self) -> None:
+        """Compact the pending edges if there are too many of them compared to the number of
+        compacted ones.
+
+        >>> graph = ComfortFoodGraph()
+        >>> graph.add_vertex('Pizza', 'food')
+        >>> for i in range(_COMPACT_MIN_PENDING):
+        ...     graph.add_vertex(f'User #{i}', 'user')
+        ...     graph.add_edge(f'User #{i}', 'Pizza', ['Stress'])
+        >>> 0 < graph._num_pending < _COMPACT_MIN_PENDING
+        True
+        >>> graph.get_degree('Pizza') == _COMPACT_MIN_PENDING
+        True
+        >>> graph.add_edge('User #0', 'Pizza', ['Boredom'])
+        >>> graph.get_reasons('User #0', 'Pizza')
+        ['Boredom']
+        >>> graph.compact()
+        >>> graph._num_pending, graph.get_degree('Pizza') == _COMPACT_MIN_PENDING
+        (0, True)
+        >>> sorted(graph.get_all_reasons())
+        ['Boredom', 'Stress']
+        """
+        if self._num_pending > max(_COMPACT_MIN_PENDING, _COMPACT_RATIO * len(self._indices)):
+            self.compact()
+
+    @metrics.timed('graph.compact')
+    def compact(self) -> None:
+        """Merge every pending edge into the CSR arrays of this graph.
+
+        This does not change the contents of the graph, only how its edges are stored.
+        """
+        if self._num_pending == 0 and len(self._indptr) == len(self._vertices_by_id) + 1:
+            return
+
+        num_rows = len(self._indptr) - 1
+        num_vertices = len(self._vertices_by_id)
+        indptr = array('q', [0])
+        indices = array('q')
+        edge_masks = array('q')
+        copied = 0
+
+        for vertex_id in [*sorted(self._pending), num_vertices]:
+            if copied < vertex_id:
+                # Copy the compacted rows of the vertices without pending edges before
+                # vertex_id all at once, shifting their offsets
+                end = min(vertex_id, num_rows)
+
+                if copied < end:
+                    start, stop = self._indptr[copied], self._indptr[end]
+                    shift = len(indices) - start
+                    indptr.extend(self._indptr[i] + shift for i in range(copied + 1, end + 1))
+                    indices.extend(self._indices[start:stop])
+                    edge_masks.extend(self._edge_masks[start:stop])
+
+                # Vertices added since the last compaction without any edge have empty rows
+                indptr.extend(itertools.repeat(len(indices), vertex_id - max(copied, end)))
+
+            if vertex_id == num_vertices:
+                break
+
+            row = self._pending[vertex_id]
+            neighbour_ids = sorted(row)
+
+            if vertex_id < num_rows:
+                start, stop = self._indptr[vertex_id], self._indptr[vertex_id + 1]
+
+                if start < stop and self._indices[stop - 1] > neighbour_ids[0]:
+                    row = {**dict(zip(self._indices[start:stop],
+                                      self._edge_masks[start:stop])), **row}
+                    neighbour_ids = sorted(row)
+                elif start < stop:
+                    # Vertices added since the last compaction have the largest ids, so their
+                    # edges usually just extend the compacted row
+                    indices.extend(self._indices[start:stop])
+                    edge_masks.extend(self._edge_masks[start:stop])
+
+            indices.extend(neighbour_ids)
+            edge_masks.extend(map(row.__getitem__, neighbour_ids))
+            indptr.append(len(indices))
+            copied = vertex_id + 1
+
+        self._indptr = indptr
+        self._indices = indices
+        self._edge_masks = edge_masks
+        self._pending = {}
+        self._num_pending = 0
+
+    def save_snapshot(self, filename: str, source_hash: str = '') -> None:
+        """Save this graph to a binary snapshot file, which can be loaded back with
+        ComfortFoodGraph.load_snapshot. The pending edges are compacted first.
+
+        `source_hash` identifies the data this graph was built from (for example the hash of
+        the dataset file), so that stale snapshots can be detected when loading them.
+
+        The snapshot holds a JSON header with the vocabularies of this graph (reasons, reason
+        masks, vertex types) followed by 8-byte aligned int64 sections: the CSR arrays, the
+        reason mask id of every edge, the type of every vertex, the reason indexes and the
+        NUL-separated vertex values.
+        """
+        self.compact()
+
+        type_names = list(self._partitions)
+        type_ids = {vertex_type: i for i, vertex_type in enumerate(type_names)}
+
+        reason_foods_indptr, reason_foods = array('q', [0]), array('q')
+        reason_users_indptr, reason_users = array('q', [0]), array('q')
+
+        for reason in self._reason_names:
+            reason_foods.extend(self._vertices[food].id
+                                for food in self._reason_foods.get(reason, ()))
+            reason_users.extend(self._vertices[user].id
+                                for user in self._reason_users.get(reason, ()))
+            reason_foods_indptr.append(len(reason_foods))
+            reason_users_indptr.append(len(reason_users))
+
+        sections = {
+            'indptr': bytes(self._indptr),
+            'indices': bytes(self._indices),
+            'edge_masks': bytes(self._edge_masks),
+            'vertex_types': bytes(array('q', (type_ids[vertex.vertex_type]
+                                              for vertex in self._vertices_by_id))),
+            'reason_foods_indptr': bytes(reason_foods_indptr),
+            'reason_foods': bytes(reason_foods),
+            'reason_users_indptr': bytes(reason_users_indptr),
+            'reason_users': bytes(reason_users),
+            'values': '\0'.join(vertex.value for vertex in self._vertices_by_id).encode(),
+        }
+
+        header = {
+            'source_hash': source_hash,
+            'byteorder': sys.byteorder,
+            'num_vertices': len(self._vertices_by_id),
+            'version': self._version,
+            'type_names': type_names,
+            'reason_names': self._reason_names,
+            'masks': [format(mask, 'x') for mask in self._masks],
+            'sections': {}
+        }
+
+        offset = 0
+        for name, data in sections.items():
+            header['sections'][name] = [offset, len(data)]
+            offset += _align(len(data))
+
+        header_bytes = json.dumps(header).encode()
+
+        with open(filename, 'wb') as file:
+            file.write(_SNAPSHOT_MAGIC)
+            file.write(struct.pack('<II', _SNAPSHOT_VERSION, len(header_bytes)))
+            file.write(header_bytes.ljust(_align(16 + len(header_bytes)) - 16, b' '))
+
+            for data in sections.values():
+                file.write(data.ljust(_align(len(data)), b'\0'))
+
+    @classmethod
+    def load_snapshot(cls, filename: str, source_hash: Optional[str] = None) \
+            -> ComfortFoodGraph:
+        """Return the graph saved in the snapshot file at filename.
+
+        Only the CSR arrays are memory-mapped, copy-on-write, so processes that load the same
+        snapshot share those pages until they change the graph. The vertex objects and the
+        reason indexes are still rebuilt in Python by each process that loads the snapshot,
+        which takes time and memory in proportion to the number of vertices (about half a
+        second for 200,000 users, rather than the seconds of parsing the dataset). To share
+        those as well, load the graph once before forking the workers.
+
+        Raise a ValueError if the file is not a snapshot in the current format, or if
+        `source_hash` is given and differs from the source hash the snapshot was saved with.
+
+        >>> import os, tempfile
+        >>> graph = ComfortFoodGraph()
+        >>> graph.add_vertices(['User #0', 'User #1'], 'user')
+        >>> graph.add_vertex('Pizza', 'food')
+        >>> graph.add_edges([('User #0', 'Pizza', ['Stress']), ('User #1', 'Pizza', ['Boredom'])])
+        >>> directory = tempfile.TemporaryDirectory()
+        >>> filename = os.path.join(directory.name, 'graph.snapshot')
+        >>> graph.save_snapshot(filename, 'hash')
+        >>> ComfortFoodGraph.load_snapshot(filename, 'other hash')
+        Traceback (most recent call last):
+        ...
+        ValueError
+        >>> loaded = ComfortFoodGraph.load_snapshot(filename, 'hash')
+        >>> sorted(loaded.get_neighbours('Pizza')), loaded.version == graph.version
+        (['User #0', 'User #1'], True)
+        >>> loaded.get_reasons('User #1', 'Pizza'), loaded.get_users_with_reason('Stress')
+        (['Boredom'], {'User #0'})
+
+        The loaded graph can be changed, without changing the snapshot file:
+
+        >>> loaded.add_edge('User #1', 'Pizza', ['Stress'])
+        >>> loaded.add_vertex('Chips', 'food')
+        >>> loaded.add_edge('User #0', 'Chips', ['Boredom'])
+        >>> sorted(loaded.get_users_with_reason('Stress')), loaded.get_foods_with_reason('Boredom')
+        (['User #0', 'User #1'], {'Chips'})
+        >>> loaded.compact()
+        >>> sorted(loaded.get_neighbours('User #0')), loaded.get_reasons('User #1', 'Pizza')
+        (['Chips', 'Pizza'], ['Stress'])
+        >>> ComfortFoodGraph.load_snapshot(filename).get_reasons('User #1', 'Pizza')
+        ['Boredom']
+        >>> directory.cleanup()
+        """
+        with open(filename, 'rb') as file:
+            snapshot = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        if snapshot[:len(_SNAPSHOT_MAGIC)] != _SNAPSHOT_MAGIC:
+            raise ValueError
+
+        format_version, header_length = struct.unpack_from('<II', snapshot, len(_SNAPSHOT_MAGIC))
+        if format_version != _SNAPSHOT_VERSION:
+            raise ValueError
+
+        header = json.loads(snapshot[16:16 + header_length])
+        if source_hash is not None and header['source_hash'] != source_hash:
+            raise ValueError
+
+        data_offset = _align(16 + header_length)
+        view = memoryview(snapshot)
+
+        def section(name: str) -> memoryview:
+            offset, length = header['sections'][name]
+            return view[data_offset + offset:data_offset + offset + length]
+
+        def int_section(name: str) -> Union[array, memoryview]:
+            if header['byteorder'] == sys.byteorder:
+                return section(name).cast('q')
+            else:
+                swapped = array('q', bytes(section(name)))
+                swapped.byteswap()
+                return swapped
+
+        graph = cls()
+        graph._version = header['version']
+        graph._indptr = int_section('indptr')
+        graph._indices = int_section('indices')
+        graph._edge_masks = int_section('edge_masks')
+
+        # Restore the vertices
+        type_names = [sys.intern(name) for name in header['type_names']]
+        values = bytes(section('values')).decode().split('\0') if header['num_vertices'] else []
+
+        for vertex_id, type_id in enumerate(int_section('vertex_types')):
+            vertex = _ComfortFoodVertex(values[vertex_id], type_names[type_id], vertex_id)
+            graph._vertices[vertex.value] = vertex
+            graph._vertices_by_id.append(vertex)
+            graph._partitions.setdefault(vertex.vertex_type, {})[vertex.value] = vertex
+
+        # Restore the reason vocabulary and reason masks
+        for reason in header['reason_names']:
+            graph._reason_ids[sys.intern(reason)] = len(graph._reason_names)
+            graph._reason_names.append(sys.intern(reason))
+
+        for mask in header['masks']:
+            mask = int(mask, 16)
+            graph._mask_ids[mask] = len(graph._masks)
+            graph._masks.append(mask)
+            graph._mask_reasons.append(tuple(reason
+                                             for i, reason in enumerate(graph._reason_names)
+                                             if mask >> i & 1))
+
+        # Restore the reason indexes
+        reason_foods_indptr = int_section('reason_foods_indptr')
+        reason_foods = int_section('reason_foods')
+        reason_users_indptr = int_section('reason_users_indptr')
+        reason_users = int_section('reason_users')
+
+        for i, reason in enumerate(graph._reason_names):
+            foods = reason_foods[reason_foods_indptr[i]:reason_foods_indptr[i + 1]]
+            users = reason_users[reason_users_indptr[i]:reason_users_indptr[i + 1]]
 
-            v1.neighbours[v2] = reasons
-            v2.neighbours[v1] = reasons
+            if len(foods) > 0:
+                graph._reasons.add(reason)
+                graph._reason_foods[reason] = {values[food_id] for food_id in foods}
+                graph._reason_users[reason] = {values[user_id] for user_id in users}
+
+        return graph
+
+    def _intern_mask(self, reasons: list[str]) -> int:
+        """Return the mask id of the bitmask representing reasons, adding any new reasons to
+        the vocabulary of this graph.
+        """
+        mask = 0
+        for reason in reasons:
+            if reason not in self._reason_ids:
+                self._reason_ids[sys.intern(reason)] = len(self._reason_names)
+                self._reason_names.append(sys.intern(reason))
+            mask |= 1 << self._reason_ids[reason]
+
+        if mask not in self._mask_ids:
+            self._mask_ids[mask] = len(self._masks)
+            self._masks.append(mask)
+            self._mask_reasons.append(tuple(reason for i, reason in enumerate(self._reason_names)
+                                            if mask >> i & 1))
+
+        return self._mask_ids[mask]
+
+    def _find_entry(self, vertex_id: int, neighbour_id: int) -> Optional[int]:
+        """Return the position of neighbour_id in the compacted row of vertex_id, or None if
+        the two vertices are not adjacent in the compacted rows.
+        """
+        if vertex_id >= len(self._indptr) - 1:
+            return None
+
+        start, end = self._indptr[vertex_id], self._indptr[vertex_id + 1]
+        i = bisect.bisect_left(self._indices, neighbour_id, start, end)
+
+        if i < end and self._indices[i] == neighbour_id:
+            return i
+        else:
+            return None
+
+    def _get_mask_id(self, vertex_id: int, neighbour_id: int) -> Optional[int]:
+        """Return the reason mask id of the edge between the two vertices, or None if they
+        are not adjacent.
+        """
+        if neighbour_id in self._pending.get(vertex_id, {}):
+            return self._pending[vertex_id][neighbour_id]
+
+        i = self._find_entry(vertex_id, neighbour_id)
+        return None if i is None else self._edge_masks[i]
+
+    def _set_mask_id(self, vertex_id: int, neighbour_id: int, mask_id: int) -> None:
+        """Set the reason mask id of the edge between the two vertices, adding the edge if
+        they are not adjacent yet.
+        """
+        for u, v in ((vertex_id, neighbour_id), (neighbour_id, vertex_id)):
+            i = self._find_entry(u, v)
+
+            if i is not None:
+                self._edge_masks[i] = mask_id
+            else:
+                if v not in self._pending.setdefault(u, {}):
+                    self._num_pending += 1
+                self._pending[u][v] = mask_id
+
+    def _neighbour_entries(self, vertex_id: int) -> Iterator[tuple[int, int]]:
+        """Yield the neighbour id and reason mask id of every edge of the given vertex."""
+        if vertex_id < len(self._indptr) - 1:
+            start, end = self._indptr[vertex_id], self._indptr[vertex_id + 1]
+            yield from zip(self._indices[start:end], self._edge_masks[start:end])
+
+        yield from self._pending.get(vertex_id, {}).items()
+
+    def _index_reasons(self, user: str, food: str, reasons: Iterable[str]) -> None:
+        """Record that user and food are adjacent through each of the given reasons."""
+        for reason in reasons:
+            self._reasons.add(reason)
+            self._reason_foods.setdefault(reason, set()).add(food)
+            self._reason_users.setdefault(reason, set()).add(user)
+
+    def _unindex_reasons(self, v1: _ComfortFoodVertex, v2: _ComfortFoodVertex,
+                         old_reasons: Iterable[str]) -> None:
+        """Remove the reasons an edge between v1 and v2 used to have from the reason indexes,
+        unless another edge of the same vertex still has that reason.
+        """
+        for reason in old_reasons:
+            bit = 1 << self._reason_ids[reason]
+
+            if not any(self._masks[mask_id] & bit
+                       for _, mask_id in self._neighbour_entries(v1.id)):
+                self._reason_users[reason].discard(v1.value)
+            if not any(self._masks[mask_id] & bit
+                       for _, mask_id in self._neighbour_entries(v2.id)):
+                self._reason_foods[reason].discard(v2.value)
+
+            if len(self._reason_foods[reason]) == 0:
+                self._reasons.discard(reason)
+                del self._reason_foods[reason]
+                del self._reason_users[reason]
 
     def get_vertex_type(self, item: str) -> str:
         """Return the vertex type of item.
@@ -73,20 +981,123 @@ class ComfortFoodGraph:
         else:
             raise ValueError
 
-    def get_vertices(self) -> set:
-        """Return a set of all vertices of this graph.
+    def get_vertex_id(self, item: str) -> int:
+        """Return the integer id of item. Ids are dense: they range from 0 to the number of
+        vertices in this graph, in the order the vertices were added.
+
+        Raise a ValueError if item is not a vertex in this graph.
+        """
+        if item in self._vertices:
+            return self._vertices[item].id
+        else:
+            raise ValueError
+
+    def get_vertex_value(self, vertex_id: int) -> str:
+        """Return the value of the vertex with the given id.
+
+        Raise a ValueError if no vertex in this graph has the given id.
+        """
+        if 0 <= vertex_id < len(self._vertices_by_id):
+            return self._vertices_by_id[vertex_id].value
+        else:
+            raise ValueError
+
+    def get_neighbour_ids(self, vertex_id: int) -> Sequence[int]:
+        """Return the ids of the neighbours of the vertex with the given id.
+
+        Raise a ValueError if no vertex in this graph has the given id.
+        """
+        if not 0 <= vertex_id < len(self._vertices_by_id):
+            raise ValueError
+
+        if vertex_id < len(self._indptr) - 1:
+            neighbour_ids = self._indices[self._indptr[vertex_id]:self._indptr[vertex_id + 1]]
+        else:
+            neighbour_ids = array('q')
+
+        if vertex_id in self._pending:
+            neighbour_ids = [*neighbour_ids, *self._pending[vertex_id]]
+
+        return neighbour_ids
+
+    def get_neighbour_mask_ids(self, vertex_id: int) -> Sequence[int]:
+        """Return the reason mask ids of the edges of the vertex with the given id, in the
+        same order as get_neighbour_ids returns its neighbours.
+
+        Raise a ValueError if no vertex in this graph has the given id.
+
+        >>> graph = ComfortFoodGraph()
+        >>> graph.add_vertices(['User #0', 'User #1'], 'user')
+        >>> graph.add_vertex('Pizza', 'food')
+        >>> graph.add_edges([('User #0', 'Pizza', ['Stress']), ('User #1', 'Pizza', ['Boredom'])])
+        >>> stress = graph.get_mask_ids_with_reason('Stress')
+        >>> pizza_id = graph.get_vertex_id('Pizza')
+        >>> [graph.get_vertex_value(neighbour_id) for neighbour_id, mask_id in
+        ...  zip(graph.get_neighbour_ids(pizza_id), graph.get_neighbour_mask_ids(pizza_id))
+        ...  if mask_id in stress]
+        ['User #0']
+        """
+        if not 0 <= vertex_id < len(self._vertices_by_id):
+            raise ValueError
+
+        if vertex_id < len(self._indptr) - 1:
+            mask_ids = self._edge_masks[self._indptr[vertex_id]:self._indptr[vertex_id + 1]]
+        else:
+            mask_ids = array('q')
+
+        if vertex_id in self._pending:
+            mask_ids = [*mask_ids, *self._pending[vertex_id].values()]
+
+        return mask_ids
+
+    def get_mask_ids_with_reason(self, reason: str) -> frozenset[int]:
+        """Return the reason mask ids of the edges with the given reason, so that those edges
+        can be found from get_neighbour_mask_ids without listing the reasons of every edge.
         """
-        return set(self._vertices.keys())
+        if reason not in self._reason_ids:
+            return frozenset()
+
+        bit = self._reason_ids[reason]
+        return frozenset(mask_id for mask_id, mask in enumerate(self._masks) if mask >> bit & 1)
+
+    def get_degree(self, item: str) -> int:
+        """Return the number of neighbours of the given item.
 
-    def get_users(self) -> set:
-        """Return a set of all user vertices og this graph.
+        Raise a ValueError if item does not appear as a vertex in this graph.
         """
-        return {v.value for v in self._vertices.values() if v.vertex_type == 'user'}
+        return len(self.get_neighbour_ids(self.get_vertex_id(item)))
+
+    def get_degrees(self) -> array:
+        """Return an array with the number of neighbours of every vertex, indexed by id."""
+        num_rows = len(self._indptr) - 1
+        degrees = array('q', (self._indptr[i + 1] - self._indptr[i] for i in range(num_rows)))
+        degrees.extend(0 for _ in range(num_rows, len(self._vertices_by_id)))
+
+        for vertex_id, edges in self._pending.items():
+            degrees[vertex_id] += len(edges)
+
+        return degrees
+
+    def get_vertices(self) -> KeysView[str]:
+        """Return a read-only set view of all vertices of this graph.
 
-    def get_foods(self) -> set:
-        """Return a set of all food vertices og this graph.
+        The view is not a copy: it reflects vertices added to this graph later on.
         """
-        return {v.value for v in self._vertices.values() if v.vertex_type == 'food'}
+        return self._vertices.keys()
+
+    def get_users(self) -> KeysView[str]:
+        """Return a read-only set view of all user vertices of this graph, in insertion order.
+
+        The view is not a copy: it reflects vertices added to this graph later on.
+        """
+        return self._partitions['user'].keys()
+
+    def get_foods(self) -> KeysView[str]:
+        """Return a read-only set view of all food vertices of this graph, in insertion order.
+
+        The view is not a copy: it reflects vertices added to this graph later on.
+        """
+        return self._partitions['food'].keys()
 
     def get_neighbours(self, item: str) -> set:
         """Return a set of the neighbours of the given item.
@@ -94,13 +1105,17 @@ class ComfortFoodGraph:
         Raise a ValueError if item does not appear as a vertex in this graph.
         """
         if item in self._vertices:
-            return {neighbour.value for neighbour in self._vertices[item].neighbours}
+            vertices = self._vertices_by_id
+            return {vertices[neighbour_id].value
+                    for neighbour_id in self.get_neighbour_ids(self._vertices[item].id)}
         else:
             raise ValueError
 
     def get_reasons(self, user: str, food: str) -> list[str]:
         """Return a list of strings representing comfort food reasons between the user and food.
 
+        The reasons are listed in the order they were first added to this graph.
+
         Return an empty list if user and food are not adjacent.
 
         Raise a ValueError if either user or food are not vertices in this graph, or if
@@ -110,21 +1125,28 @@ class ComfortFoodGraph:
                 self._vertices[user].vertex_type == self._vertices[food].vertex_type:
             raise ValueError
         else:
-            v1 = self._vertices[user]
-            v2 = self._vertices[food]
-            return v1.neighbours.get(v2, [])
+            mask_id = self._get_mask_id(self._vertices[user].id, self._vertices[food].id)
+            return [] if mask_id is None else list(self._mask_reasons[mask_id])
 
     def get_all_reasons(self) -> set[str]:
         """Return a set of all comfort foods reasons in this graph."""
-        reasons = set()
+        return set(self._reasons)
 
-        for v in self.get_users():
-            for u in self.get_neighbours(v):
-                for reason in self.get_reasons(v, u):
-                    reasons.add(reason)
+    def get_foods_with_reason(self, reason: str) -> set[str]:
+        """Return a set of the foods that have at least one edge with the given reason.
 
-        return reasons
+        Return an empty set if no edge in this graph has the given reason.
+        """
+        return set(self._reason_foods.get(reason, ()))
 
+    def get_users_with_reason(self, reason: str) -> set[str]:
+        """Return a set of the users that have at least one edge with the given reason.
+
+        Return an empty set if no edge in this graph has the given reason.
+        """
+        return set(self._reason_users.get(reason, ()))
+
+    @metrics.timed('graph.create_subgraph')
     def create_subgraph(self, foods: list[str]) -> ComfortFoodGraph:
         """Return a subgraph of this current ComfortFoodGraph with only the given foods and users
         that are neighbours with at least one food from `foods`.
@@ -136,34 +1158,227 @@ class ComfortFoodGraph:
         if len(foods) == 0 or foods == ['']:
             return subgraph
 
-        # Only add users into subgraph if they are neighbours with at least one food in `foods`
-        for user in self.get_users():
-            if any(food in self.get_neighbours(user) for food in foods):
-                subgraph.add_vertex(user, 'user')
+        # Only add users into subgraph if they are neighbours with at least one food in `foods`,
+        # found from the neighbourhoods of the foods rather than by checking every user
+        subgraph.add_vertices(_union_of_neighbours(self, foods), 'user')
 
         # Add the given foods into the subgraph
         for food in foods:
             subgraph.add_vertex(food, 'food')
 
             # Add any edges between the food and every user
-            for user in self.get_neighbours(food):
-                reasons = self.get_reasons(user, food)
-                subgraph.add_edge(user, food, reasons)
+            subgraph.add_edges((user, food, self.get_reasons(user, food))
+                               for user in self.get_neighbours(food))
 
         return subgraph
 
+    def subgraph_view(self, foods: list[str]) -> ComfortFoodSubgraphView:
+        """Return a read-only view of the subgraph of this graph with only the given foods and
+        users that are neighbours with at least one food from `foods`.
+
+        Unlike create_subgraph, nothing is copied: the view shares the storage of this graph.
+
+        Raise a ValueError if any of the foods is not a vertex in this graph.
+        """
+        return ComfortFoodSubgraphView(self, foods)
+
+    @metrics.timed('graph.to_networkx')
     def to_networkx(self) -> nx.Graph:
         """Convert this graph into a networkx Graph.
+
+        networkx is only imported when this method is called, so it is an optional
+        dependency of this module.
         """
+        import networkx as nx
+
         nx_graph = nx.Graph()
 
-        for v in self.get_vertices():
-            nx_graph.add_node(v, vertex_type=self.get_vertex_type(v))
+        # Add every vertex once, then every edge once (from its user)
+        nx_graph.add_nodes_from((v, {'vertex_type': self.get_vertex_type(v)})
+                                for v in self.get_vertices())
+        nx_graph.add_edges_from((user, food) for user in self.get_users()
+                                for food in self.get_neighbours(user))
+
+        return nx_graph
 
-            for u in self.get_neighbours(v):
-                nx_graph.add_node(u, vertex_type=self.get_vertex_type(u))
 
-                if u in nx_graph.nodes:
-                    nx_graph.add_edge(v, u)
+class ComfortFoodSubgraphView:
+    """A read-only view of the subgraph of a ComfortFoodGraph induced by some of its foods and
+    every user that is a neighbour of at least one of those foods.
+
+    The view shares the storage of its graph: it only keeps the sets of foods and users in
+    the view, which are computed from the neighbourhoods of the foods. It supports the same
+    read methods as ComfortFoodGraph. Vertex ids are the ids in the graph, so they are not
+    dense in the view.
+
+    Instance Attributes:
+        - graph: The graph this is a view of
+    """
+    graph: ComfortFoodGraph
+
+    # Private Instance Attributes:
+    #   - _foods: The foods in this view, in the order they were given
+    #   - _users: The users in this view, in the order they were added to the graph
+    _foods: dict[str, None]
+    _users: dict[str, None]
+
+    def __init__(self, graph: ComfortFoodGraph, foods: list[str]) -> None:
+        """Initialize a view of the subgraph of graph induced by foods and their neighbours.
+
+        Raise a ValueError if any of the foods is not a vertex in graph.
+        """
+        self.graph = graph
+
+        if len(foods) == 0 or foods == ['']:
+            foods = []
+
+        self._foods = dict.fromkeys(foods)
+        self._users = dict.fromkeys(_union_of_neighbours(graph, foods))
+
+    @property
+    def version(self) -> int:
+        """The version of the graph this is a view of."""
+        return self.graph.version
+
+    def __contains__(self, item: str) -> bool:
+        """Return whether item is a vertex in this view."""
+        return item in self._foods or item in self._users
+
+    def get_vertex_type(self, item: str) -> str:
+        """Return the vertex type of item.
+
+        Raise a ValueError if item is not a vertex in this view.
+        """
+        if item in self:
+            return self.graph.get_vertex_type(item)
+        else:
+            raise ValueError
+
+    def get_vertex_id(self, item: str) -> int:
+        """Return the id of item in the graph.
+
+        Raise a ValueError if item is not a vertex in this view.
+        """
+        if item in self:
+            return self.graph.get_vertex_id(item)
+        else:
+            raise ValueError
+
+    def get_vertex_value(self, vertex_id: int) -> str:
+        """Return the value of the vertex with the given id in the graph.
+
+        Raise a ValueError if no vertex in this view has the given id.
+        """
+        value = self.graph.get_vertex_value(vertex_id)
+
+        if value in self:
+            return value
+        else:
+            raise ValueError
+
+    def get_neighbour_ids(self, vertex_id: int) -> list[int]:
+        """Return the ids of the neighbours in this view of the vertex with the given id.
+
+        Raise a ValueError if no vertex in this view has the given id.
+        """
+        self.get_vertex_value(vertex_id)
+
+        return [neighbour_id for neighbour_id in self.graph.get_neighbour_ids(vertex_id)
+                if self.graph.get_vertex_value(neighbour_id) in self]
+
+    def get_degree(self, item: str) -> int:
+        """Return the number of neighbours of the given item in this view.
+
+        Raise a ValueError if item is not a vertex in this view.
+        """
+        return len(self.get_neighbours(item))
+
+    def get_vertices(self) -> set[str]:
+        """Return a set of all vertices of this view."""
+        return self._users.keys() | self._foods.keys()
+
+    def get_users(self) -> KeysView[str]:
+        """Return a read-only set view of all user vertices of this view."""
+        return self._users.keys()
+
+    def get_foods(self) -> KeysView[str]:
+        """Return a read-only set view of all food vertices of this view."""
+        return self._foods.keys()
+
+    def get_neighbours(self, item: str) -> set:
+        """Return a set of the neighbours of the given item in this view.
+
+        Raise a ValueError if item is not a vertex in this view.
+        """
+        if item in self._foods:
+            # Every neighbour of a food in the view is in the view
+            return self.graph.get_neighbours(item)
+        elif item in self._users:
+            return {food for food in self.graph.get_neighbours(item) if food in self._foods}
+        else:
+            raise ValueError
+
+    def get_reasons(self, user: str, food: str) -> list[str]:
+        """Return a list of strings representing comfort food reasons between the user and food.
+
+        Return an empty list if user and food are not adjacent.
+
+        Raise a ValueError if either user or food are not vertices in this view, or if
+        user and food are the same vertex type.
+        """
+        if user not in self or food not in self:
+            raise ValueError
+        else:
+            return self.graph.get_reasons(user, food)
+
+    def get_all_reasons(self) -> set[str]:
+        """Return a set of all comfort foods reasons in this view."""
+        return {reason for reason in self.graph.get_all_reasons()
+                if len(self.get_foods_with_reason(reason)) > 0}
+
+    def get_foods_with_reason(self, reason: str) -> set[str]:
+        """Return a set of the foods in this view that have at least one edge with the given
+        reason.
+        """
+        return self.graph.get_foods_with_reason(reason).intersection(self._foods)
+
+    def get_users_with_reason(self, reason: str) -> set[str]:
+        """Return a set of the users in this view that have at least one edge in this view
+        with the given reason.
+        """
+        return {user for user in self.graph.get_users_with_reason(reason).intersection(self._users)
+                if any(reason in self.graph.get_reasons(user, food)
+                       for food in self.get_neighbours(user))}
+
+    def create_subgraph(self, foods: list[str]) -> ComfortFoodGraph:
+        """Return a copy of the subgraph of the graph with only the given foods of this view
+        and users that are neighbours with at least one of them.
+        """
+        return self.graph.create_subgraph([food for food in foods if food in self._foods])
+
+    def to_networkx(self) -> nx.Graph:
+        """Convert this view into a networkx Graph.
+        """
+        import networkx as nx
+
+        nx_graph = nx.Graph()
+
+        nx_graph.add_nodes_from((v, {'vertex_type': self.get_vertex_type(v)})
+                                for v in self.get_vertices())
+        nx_graph.add_edges_from((user, food) for food in self.get_foods()
+                                for user in self.get_neighbours(food))
 
         return nx_graph
+
+
+def _union_of_neighbours(graph: ComfortFoodGraph, foods: list[str]) -> list[str]:
+    """Return every user that is a neighbour of at least one of the foods in graph, in the
+    order the users were added to graph.
+
+    Raise a ValueError if any of the foods is not a vertex in graph.
+    """
+    user_ids = set()
+    for food in foods:
+        user_ids.update(graph.get_neighbour_ids(graph.get_vertex_id(food)))
+
+    return [graph.get_vertex_value(user_id) for user_id in sorted(user_ids)]
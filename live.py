@@ -0,0 +1,132 @@
+"""
+FoodFinder
+by Kenneth Tran
+
+Add new survey respondents to the graph while the app is serving requests.
+"""
+
+import threading
+from typing import NamedTuple, Optional, Union
+
+import load
+from graph import ComfortFoodGraph
+from similarity import SimilarityEngine, SimilarityTable
+
+
+class LiveSnapshot(NamedTuple):
+    """A published version of the graph, together with the engine built for it. Neither is
+    ever changed once it is published.
+    """
+    graph: ComfortFoodGraph
+    engine: Union[SimilarityEngine, SimilarityTable]
+
+
+class _WriteBatch:
+    """The respondents of the writes waiting to be published together.
+
+    Instance Attributes:
+        - respondents: The respondents of every write in this batch, in the order they came
+        - version: The version of the graph this batch was published in, or None if it has
+            not been published yet
+    """
+    respondents: list[tuple[list[str], list[str]]]
+    version: Optional[int]
+
+    def __init__(self) -> None:
+        self.respondents = []
+        self.version = None
+
+
+class LiveComfortFoodGraph:
+    """A ComfortFoodGraph that new respondents can be added to while requests are being served
+    from it.
+
+    Requests read the current snapshot, which is never changed. New respondents are added to a
+    copy of the current graph (and of its similarity table, which is updated incrementally as
+    their edges are added), and the copy is then published as the new snapshot in a single
+    assignment. Readers never wait for a writer, and each request sees one consistent version
+    of the graph for as long as it holds its snapshot.
+
+    Copying the graph and its engine takes time proportional to the size of the graph (about
+    0.1 to 0.2 seconds at 200,000 users), however few respondents are added, and every
+    publish invalidates the caches keyed on the graph version. So writes are serialized, and
+    the writes that arrive while a publish is in progress are all published together by the
+    next one.
+
+    The versions of successive snapshots always increase, so caches keyed on the graph version
+    stay valid.
+    """
+    # Private Instance Attributes:
+    #   - _snapshot: The current snapshot
+    #   - _lock: The lock serializing publishes
+    #   - _batch: The batch that new writes join, published by the next publish
+    #   - _batch_lock: The lock guarding _batch
+    _snapshot: LiveSnapshot
+    _lock: threading.Lock
+    _batch: _WriteBatch
+    _batch_lock: threading.Lock
+
+    def __init__(self, graph: ComfortFoodGraph,
+                 engine: Union[SimilarityEngine, SimilarityTable, None] = None) -> None:
+        """Initialize a live graph starting from graph and the engine built for it (by
+        default, a new SimilarityEngine).
+
+        graph must not be changed directly anymore once it is passed in.
+        """
+        if engine is None:
+            engine = SimilarityEngine(graph)
+
+        self._snapshot = LiveSnapshot(graph, engine)
+        self._lock = threading.Lock()
+        self._batch = _WriteBatch()
+        self._batch_lock = threading.Lock()
+
+    def snapshot(self) -> LiveSnapshot:
+        """Return the current snapshot, which must not be changed."""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        """The version of the graph of the current snapshot."""
+        return self._snapshot.graph.version
+
+    def add_respondents(self, respondents: list[tuple[list[str], list[str]]]) -> int:
+        """Add a user for every (comfort foods, comfort food reasons) pair in respondents,
+        numbered after the existing users, and return the version of the graph they were
+        published in.
+
+        The respondents may be published together with those of other concurrent calls.
+        """
+        with self._batch_lock:
+            batch = self._batch
+            batch.respondents.extend(respondents)
+
+        with self._lock:
+            # An earlier call may have published this batch while this one was waiting
+            if batch.version is None:
+                with self._batch_lock:
+                    self._batch = _WriteBatch()
+
+                batch.version = self._publish(batch.respondents)
+
+        return batch.version
+
+    def _publish(self, respondents: list[tuple[list[str], list[str]]]) -> int:
+        """Publish a new snapshot with a user for every (comfort foods, comfort food reasons)
+        pair in respondents, and return its version. The caller must hold self._lock.
+        """
+        current = self._snapshot
+        graph = current.graph.copy()
+
+        # The copied table tracks the new edges as they are added, while a new engine is
+        # only built once they are all in the graph, so that it is never rebuilt later
+        if isinstance(current.engine, SimilarityTable):
+            engine = current.engine.copy(graph)
+            load.add_respondents(graph, respondents, len(graph.get_users()))
+        else:
+            load.add_respondents(graph, respondents, len(graph.get_users()))
+            engine = SimilarityEngine(graph)
+
+        self._snapshot = LiveSnapshot(graph, engine)
+
+        return graph.version
@@ -5,42 +5,312 @@ by Kenneth Tran
 Load the dataset.
 """
 
+import bz2
+import contextlib
 import csv
+import gc
+import gzip
+import hashlib
+import itertools
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, TextIO, Union
 
-from graph import ComfortFoodGraph
+from graph import ComfortFoodGraph, UserBlock
+
+# The extensions of dataset files, which may be compressed
+DATASET_EXTENSIONS = ('.csv', '.csv.gz', '.csv.bz2')
+
+# The magic numbers at the start of compressed dataset files
+_GZIP_MAGIC = b'\x1f\x8b'
+_BZ2_MAGIC = b'BZh'
 
 
 def load_comfort_food_graph(filename: str) -> ComfortFoodGraph:
     """Return a ComfortFoodFraph from extracting the relevant data from the Food choices
     dataset (cleaned).
+
+    The file may be compressed with gzip or bz2.
+    """
+    return stream_comfort_food_graph(filename)
+
+
+def load_comfort_food_graph_cached(filename: str, snapshot_filename: Optional[str] = None) \
+        -> ComfortFoodGraph:
+    """Return a ComfortFoodGraph for the Food choices dataset (cleaned) at filename, loading it
+    from a binary snapshot when possible.
+
+    The snapshot is stored at snapshot_filename (by default, filename with a .snapshot
+    suffix). If it is missing, or if it was built from a dataset file with a different
+    SHA-256 hash, the graph is rebuilt from the dataset and the snapshot is saved again. If
+    the snapshot cannot be saved, the rebuilt graph is still returned.
+    """
+    if snapshot_filename is None:
+        snapshot_filename = filename + '.snapshot'
+
+    source_hash = hash_file(filename)
+
+    try:
+        return ComfortFoodGraph.load_snapshot(snapshot_filename, source_hash)
+    except (OSError, ValueError):
+        graph = stream_comfort_food_graph(filename)
+
+    # Write to a temporary file first so that other processes never see a partial snapshot
+    temp_filename = f'{snapshot_filename}.{os.getpid()}.tmp'
+
+    try:
+        graph.save_snapshot(temp_filename, source_hash)
+        os.replace(temp_filename, snapshot_filename)
+    except OSError:
+        # The snapshot is only a cache, so a directory that cannot be written to is not fatal
+        with contextlib.suppress(OSError):
+            os.remove(temp_filename)
+
+    return graph
+
+
+def hash_file(filename: str) -> str:
+    """Return the hex SHA-256 hash of the contents of the file at filename."""
+    file_hash = hashlib.sha256()
+
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+def stream_comfort_food_graph(filename: str, chunk_size: int = 10000,
+                              progress: Optional[Callable[[int, float], None]] = None) \
+        -> ComfortFoodGraph:
+    """Return a ComfortFoodGraph from the Food choices dataset (cleaned), reading the file
+    `chunk_size` rows at a time so that only one chunk of rows is held in memory.
+
+    The edges of each chunk are inserted into the graph in bulk. Besides the edges, loading
+    interns the reasons of every edge and builds the reason indexes, so it takes somewhat
+    longer than filling plain adjacency dictionaries would, in exchange for a graph that
+    takes much less memory.
+
+    If `progress` is given, it is called after each chunk with the number of rows loaded so
+    far and the number of rows loaded per second.
+
+    The file may be compressed with gzip or bz2, in which case it is decompressed while it
+    is read.
     """
-    with open(filename) as csv_file:
+    graph = ComfortFoodGraph()
+
+    with open_dataset(filename) as csv_file, _paused_gc():
         reader = csv.reader(csv_file)
 
-        graph = ComfortFoodGraph()
+        # Skip header
+        next(reader)
+
+        start = time.perf_counter()
+        rows_so_far = 0
+
+        while True:
+            chunk = list(itertools.islice(reader, chunk_size))
+
+            if len(chunk) == 0:
+                break
+
+            _add_rows(graph, chunk, rows_so_far)
+            rows_so_far += len(chunk)
+
+            if progress is not None:
+                elapsed = time.perf_counter() - start
+                progress(rows_so_far, rows_so_far / elapsed if elapsed > 0 else 0.0)
+
+    # Merge the remaining pending edges into the compact adjacency arrays
+    graph.compact()
+
+    return graph
+
+
+@contextlib.contextmanager
+def _paused_gc() -> Iterator[None]:
+    """Pause the cyclic garbage collector while loading a graph.
+
+    Loading allocates millions of containers that are never part of a reference cycle, and
+    the collector would otherwise scan all of them again every time it runs.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def load_sharded_comfort_food_graph(shards: Union[str, list[str]],
+                                    processes: Optional[int] = None) -> ComfortFoodGraph:
+    """Return a ComfortFoodGraph from a dataset split into several shards, each a Food
+    choices dataset file (cleaned) with its own header row.
+
+    `shards` is either a list of shard filenames or a directory, in which case every file in
+    the directory with one of the DATASET_EXTENSIONS is a shard, in sorted filename order.
+    Worker processes (`processes` of them, by default one per CPU) parse the shards in
+    parallel into blocks of users with their adjacency rows and reason indexes already
+    built, which are then added to the graph in order. The graph is the same as loading the
+    concatenation of the shards: users are numbered `User #{index}` across all shards,
+    starting from the first row of the first shard.
+    """
+    if isinstance(shards, str):
+        shards = sorted(os.path.join(shards, name) for name in os.listdir(shards)
+                        if name.endswith(DATASET_EXTENSIONS)
+                        and os.path.isfile(os.path.join(shards, name)))
+
+    graph = ComfortFoodGraph()
+    rows_so_far = 0
+
+    with ProcessPoolExecutor(processes) as executor, _paused_gc():
+        # Worker processes are only started on the first submitted shard
+        if processes == 1:
+            blocks = map(_parse_shard, shards)
+        else:
+            blocks = executor.map(_parse_shard, shards)
+
+        # Merge each shard as soon as it is parsed, in shard order
+        for block in blocks:
+            num_rows = len(block.user_masks)
+            graph.add_user_block([f'User #{index}' for index in
+                                  range(rows_so_far, rows_so_far + num_rows)], block)
+            rows_so_far += num_rows
+
+    # Merge the remaining pending edges into the compact adjacency arrays
+    graph.compact()
+
+    return graph
+
+
+def _parse_shard(filename: str) -> UserBlock:
+    """Parse every row of the shard at filename into a block of users, which is cheap to
+    send between processes.
+    """
+    with open_dataset(filename) as csv_file:
+        reader = csv.reader(csv_file)
 
         # Skip header
         next(reader)
 
-        # Each row represents one user
-        for index, row in enumerate(reader):
-            user_comfort_foods_raw = row[0]
-            user_comfort_foods_reason_raw = row[1]
+        return build_user_block(_parse_row(row) for row in reader)
+
+
+def build_user_block(respondents: Iterable[tuple[list[str], list[str]]]) -> UserBlock:
+    """Return a block of users with a user for every (comfort foods, comfort food reasons)
+    pair in respondents, in order.
+
+    The adjacency rows of the users and their foods and the reason indexes are all built
+    here, so that adding the block to a graph only has to remap their ids.
+    """
+    food_ids = {}
+    reason_ids = {}
+    mask_ids = {}
+    block = UserBlock([], [], [], array('q'), array('q', [0]), array('q', [0]), array('q'),
+                      array('q', [0]), array('q'), array('q', [0]), array('q'), array('q', [0]),
+                      array('q'))
+
+    # The users of each food, and the foods and the users of each reason, by local id
+    food_users = []
+    reason_foods = []
+    reason_users = []
+
+    for user_id, (user_comfort_foods, user_comfort_foods_reasons) in enumerate(respondents):
+        for food in user_comfort_foods:
+            if food not in food_ids:
+                food_ids[food] = len(block.foods)
+                block.foods.append(food)
+                food_users.append(array('q'))
+
+        for reason in user_comfort_foods_reasons:
+            if reason not in reason_ids:
+                reason_ids[reason] = len(block.reasons)
+                block.reasons.append(reason)
+                reason_foods.append({})
+                reason_users.append(array('q'))
 
-            # A list of comfort foods that the user likes
-            user_comfort_foods = [comfort_food.strip()
-                                  for comfort_food in user_comfort_foods_raw.split(',')]
+        row = dict.fromkeys(food_ids[food] for food in user_comfort_foods)
+        mask = tuple(sorted({reason_ids[reason] for reason in user_comfort_foods_reasons}))
 
-            # A list of reasons why the user likes the comfort foods
-            user_comfort_foods_reasons = [comfort_food_reason.strip()
-                                          for comfort_food_reason in
-                                          user_comfort_foods_reason_raw.split(',')]
+        if mask not in mask_ids:
+            mask_ids[mask] = len(block.masks)
+            block.masks.append(mask)
+
+        block.user_masks.append(mask_ids[mask])
+        block.new_food_indptr.append(len(block.foods))
+        block.food_ids.extend(row)
+        block.food_indptr.append(len(block.food_ids))
+
+        for food_id in row:
+            food_users[food_id].append(user_id)
+
+        for reason_id in mask:
+            reason_foods[reason_id].update(row)
+            reason_users[reason_id].append(user_id)
+
+    for users in food_users:
+        block.user_ids.extend(users)
+        block.user_indptr.append(len(block.user_ids))
+
+    for foods, users in zip(reason_foods, reason_users):
+        block.reason_food_ids.extend(foods)
+        block.reason_food_indptr.append(len(block.reason_food_ids))
+        block.reason_user_ids.extend(users)
+        block.reason_user_indptr.append(len(block.reason_user_ids))
+
+    return block
+
+
+def open_dataset(filename: str) -> TextIO:
+    """Open the dataset file at filename for reading as text, decompressing it on the fly if
+    it is compressed with gzip or bz2.
+    """
+    with open(filename, 'rb') as file:
+        magic = file.read(3)
+
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.open(filename, 'rt', newline='')
+    elif magic.startswith(_BZ2_MAGIC):
+        return bz2.open(filename, 'rt', newline='')
+    else:
+        return open(filename, newline='')
+
+
+def _add_rows(graph: ComfortFoodGraph, rows: list[list[str]], first_index: int) -> None:
+    """Add the users described by rows to graph, where the first row is the user with
+    index first_index.
+    """
+    add_respondents(graph, [_parse_row(row) for row in rows], first_index)
+
+
+def add_respondents(graph: ComfortFoodGraph, respondents: list[tuple[list[str], list[str]]],
+                    first_index: int) -> None:
+    """Add a user to graph for every (comfort foods, comfort food reasons) pair in
+    respondents, where the first respondent is the user with index first_index.
+    """
+    # Each respondent represents one user
+    graph.add_users((f'User #{index}', user_comfort_foods, user_comfort_foods_reasons)
+                    for index, (user_comfort_foods, user_comfort_foods_reasons)
+                    in enumerate(respondents, first_index))
+
+
+def _parse_row(row: list[str]) -> tuple[list[str], list[str]]:
+    """Return the comfort foods and the comfort food reasons of the user in row.
+    """
+    user_comfort_foods_raw = row[0]
+    user_comfort_foods_reason_raw = row[1]
 
-            # Add each user as a vertex
-            graph.add_vertex(f'User #{index}', 'user')
+    # A list of comfort foods that the user likes
+    user_comfort_foods = [comfort_food.strip()
+                          for comfort_food in user_comfort_foods_raw.split(',')]
 
-            for food in user_comfort_foods:
-                graph.add_vertex(food, 'food')
-                graph.add_edge(f'User #{index}', food, user_comfort_foods_reasons)
+    # A list of reasons why the user likes the comfort foods
+    user_comfort_foods_reasons = [comfort_food_reason.strip()
+                                  for comfort_food_reason in
+                                  user_comfort_foods_reason_raw.split(',')]
 
-        return graph
+    return user_comfort_foods, user_comfort_foods_reasons
@@ -5,45 +5,184 @@ by Kenneth Tran
 main.py
 
 Main module to be executed.
+
+The app can also be served by a preforking server, by loading it once before the workers
+are forked so that they share the memory of the graph, for example:
+    gunicorn --preload --workers 4 'main:create_app()'
 """
 
-from typing import Any
+from typing import Any, Optional
 
 from flask import Flask, render_template, redirect, url_for
+import json
+import logging
 import os
+import time
 
 import load
+import metrics
+from cache import RecommendationCache
+from live import LiveComfortFoodGraph
+from random_walk import RandomWalkRecommender
+from scoring import ScoringPipeline
+from similarity import SimilarityEngine, SimilarityTable
+from warmup import WarmupTable
 
 from views import views
 
-app = Flask(__name__)
+# The configuration of the app, unless create_app is given other values
+DEFAULT_CONFIG = {
+    # The food choices dataset file, and its binary snapshot (by default, next to it)
+    'DATASET': 'data/food_choices_clean.csv',
+    'SNAPSHOT': None,
+    # The weights of a ScoringPipeline to score recommendations with instead of the default
+    # scoring, for example {"jaccard": 1, "adamic_adar": 0.5, "reason_overlap": 2}
+    'SCORING_WEIGHTS': None,
+    # Whether to precompute the similarities between all pairs of foods at startup and keep
+    # them up to date, instead of computing the similarities of each liked food on demand
+    # (this takes longer to start, and memory grows with the square of the number of foods)
+    'SIMILARITY_TABLE': False,
+    # Whether to precompute the ranked candidates of every food at startup, so that the
+    # recommendations for a single liked food are merged from precomputed lists (this takes
+    # longer to start)
+    'WARMUP': False,
+    # Whether to recommend by a random walk from the liked foods, which also reaches foods
+    # that share no user with them
+    'RANDOM_WALK': False,
+    # Whether to accept new respondents at /api/respondents while the app is running
+    'LIVE': False,
+    # Whether to record request metrics for /metrics, and whether to profile requests with
+    # the X-Profile header
+    'METRICS': False,
+    'PROFILING': False,
+    # The secret key of the app (by default, a random one)
+    'SECRET_KEY': None
+}
 
 
-@app.route('/')
 def root() -> Any:
     """Root route."""
     return render_template('index.html')
 
 
-@app.errorhandler(404)
 def page_not_found(e) -> Any:
     """Route to handle 404 errors."""
     return redirect(url_for('root'))
 
 
-if __name__ == '__main__':
-    app.secret_key = os.urandom(12)
+def create_app(config: Optional[dict[str, Any]] = None) -> Flask:
+    """Return the FoodFinder app with the graph loaded, configured by the values of config
+    that differ from DEFAULT_CONFIG (by default, the values from config_from_environment).
+
+    The time taken to create the app is logged and stored in its COLD_START_SECONDS config.
+    Visualization dependencies are only imported by the first request that needs them.
+
+    Raise a ValueError if config sets both SCORING_WEIGHTS and RANDOM_WALK, or sets LIVE
+    together with either of them, since those settings cannot be used together.
+    """
+    start = time.perf_counter()
+
+    if config is None:
+        config = config_from_environment()
+
+    config = {**DEFAULT_CONFIG, **config}
+
+    if config['SCORING_WEIGHTS'] is not None and config['RANDOM_WALK']:
+        raise ValueError('SCORING_WEIGHTS and RANDOM_WALK cannot both be set: the random walk '
+                         'does not use scoring weights')
+
+    if config['LIVE'] and (config['SCORING_WEIGHTS'] is not None or config['RANDOM_WALK']):
+        raise ValueError('LIVE cannot be set with SCORING_WEIGHTS or RANDOM_WALK: their '
+                         'scorers are bound to the graph as it was loaded')
 
-    food_choices_path = 'data/food_choices_clean.csv'
+    app = Flask(__name__)
+
+    # Report the startup times below, unless the logging of the app is configured otherwise
+    if app.logger.level == logging.NOTSET:
+        app.logger.setLevel(logging.INFO)
+
+    app.secret_key = config['SECRET_KEY'] or os.urandom(12)
+    app.add_url_rule('/', 'root', root)
+    app.register_error_handler(404, page_not_found)
+
+    food_choices_path = config['DATASET']
 
     # Display error message if the food choices dataset is not found
     if not os.path.isfile(food_choices_path):
         raise FileNotFoundError(f'The food choices dataset file: {food_choices_path} was not found')
 
-    # Load the graph
-    comfort_graph = load.load_comfort_food_graph(food_choices_path)
+    # Load the graph, from its binary snapshot if the dataset did not change
+    comfort_graph = load.load_comfort_food_graph_cached(food_choices_path, config['SNAPSHOT'])
+
+    if config['SIMILARITY_TABLE']:
+        # Precompute the similarities between all foods so recommendations only look them up
+        engine = SimilarityTable(comfort_graph)
+    else:
+        engine = SimilarityEngine(comfort_graph)
+
+    warmup = None
+
+    if config['WARMUP']:
+        warmup = WarmupTable(comfort_graph)
+        app.logger.info('Warmed up the recommendations in %.3f seconds, using %.0f KiB',
+                        warmup.build_seconds, warmup.nbytes / 1024)
+
+    # Cache the recommendations of the most popular queries
+    cache = RecommendationCache(maxsize=1024)
+
+    scorer = None
+
+    if config['SCORING_WEIGHTS'] is not None:
+        # Share the co-occurrences already counted by the similarity table, if there is one
+        table = engine if isinstance(engine, SimilarityTable) else None
+        scorer = ScoringPipeline(comfort_graph, config['SCORING_WEIGHTS'], table)
+    elif config['RANDOM_WALK']:
+        scorer = RandomWalkRecommender(comfort_graph)
+
+    live = None
+
+    if config['LIVE']:
+        live = LiveComfortFoodGraph(comfort_graph, engine)
+
+    profiles = None
+
+    if config['METRICS']:
+        metrics.enable()
+
+        if config['PROFILING']:
+            profiles = metrics.ProfileStore()
 
     # Register Blueprints for routes in other modules
-    app.register_blueprint(views.construct_blueprint(comfort_graph))
+    app.register_blueprint(views.construct_blueprint(comfort_graph, engine, cache,
+                                                     scorer=scorer, live=live,
+                                                     profiles=profiles, warmup=warmup))
+
+    app.config['COLD_START_SECONDS'] = time.perf_counter() - start
+    app.logger.info('Created the app in %.3f seconds', app.config['COLD_START_SECONDS'])
+
+    return app
 
-    app.run(debug=True)
+
+def config_from_environment() -> dict[str, Any]:
+    """Return the configuration set by environment variables: FOODFINDER_DATASET,
+    FOODFINDER_SNAPSHOT, FOODFINDER_SCORING_WEIGHTS (as JSON), and
+    FOODFINDER_SIMILARITY_TABLE, FOODFINDER_WARMUP, FOODFINDER_RANDOM_WALK, FOODFINDER_LIVE,
+    FOODFINDER_METRICS and FOODFINDER_PROFILING (enabled when set to 1).
+    """
+    config = {}
+
+    for name in ('DATASET', 'SNAPSHOT'):
+        if f'FOODFINDER_{name}' in os.environ:
+            config[name] = os.environ[f'FOODFINDER_{name}']
+
+    if 'FOODFINDER_SCORING_WEIGHTS' in os.environ:
+        config['SCORING_WEIGHTS'] = json.loads(os.environ['FOODFINDER_SCORING_WEIGHTS'])
+
+    for name in ('SIMILARITY_TABLE', 'WARMUP', 'RANDOM_WALK', 'LIVE', 'METRICS', 'PROFILING'):
+        config[name] = os.environ.get(f'FOODFINDER_{name}') == '1'
+
+    return config
+
+
+if __name__ == '__main__':
+    create_app().run(debug=True)
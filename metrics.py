@@ -0,0 +1,335 @@
+"""
+FoodFinder
+by Kenneth Tran
+
+Opt-in timers, counters and a sampling profiler for finding where request time goes.
+
+Nothing is recorded until enable is called; until then, every function in this module
+returns right away.
+"""
+
+import functools
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, ContextManager, Optional
+
+# The upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+
+# Whether metrics are recorded
+_enabled = False
+
+
+class _Histogram:
+    """The cumulative bucket counts, sum and count of the observations of one series.
+
+    Instance Attributes:
+        - bucket_counts: The number of observations at most each bound of LATENCY_BUCKETS
+        - total: The sum of all observations
+        - count: The number of observations
+    """
+    __slots__ = ('bucket_counts', 'total', 'count')
+    bucket_counts: list[int]
+    total: float
+    count: int
+
+    def __init__(self) -> None:
+        """Initialize an empty histogram."""
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Record one observation."""
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """The counters and histograms recorded by this process.
+
+    Every series is identified by a metric name and a tuple of (label, value) pairs.
+    """
+    # Private Instance Attributes:
+    #   - _counters: Maps each counter series to its value
+    #   - _histograms: Maps each histogram series to its histogram
+    #   - _lock: The lock guarding the series
+    _counters: dict[tuple[str, tuple[tuple[str, str], ...]], float]
+    _histograms: dict[tuple[str, tuple[tuple[str, str], ...]], _Histogram]
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        """Initialize a registry without any series."""
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        """Add amount to the counter with the given name and labels."""
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Record value in the histogram with the given name and labels."""
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = _Histogram()
+            self._histograms[key].observe(value)
+
+    def clear(self) -> None:
+        """Remove every series."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """Return every series in the Prometheus text exposition format."""
+        lines = []
+
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f'# TYPE {name} counter')
+                for (series_name, labels), value in sorted(self._counters.items()):
+                    if series_name == name:
+                        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f'# TYPE {name} histogram')
+                for (series_name, labels), histogram in sorted(self._histograms.items(),
+                                                               key=lambda item: item[0]):
+                    if series_name != name:
+                        continue
+
+                    for bound, count in zip(LATENCY_BUCKETS, histogram.bucket_counts):
+                        lines.append(f'{name}_bucket'
+                                     f'{_format_labels(labels + (("le", str(bound)),))} {count}')
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} '
+                                 f'{histogram.count}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {histogram.total}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    """Return labels in the Prometheus text format.
+
+    >>> _format_labels((('route', 'views.choose_foods'), ('status', '200')))
+    '{route="views.choose_foods",status="200"}'
+    >>> _format_labels(())
+    ''
+    """
+    if len(labels) == 0:
+        return ''
+
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(labels, escaped)) \
+        + '}'
+
+
+# The registry of this process
+registry = MetricsRegistry()
+
+
+def enable() -> None:
+    """Start recording metrics."""
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    """Stop recording metrics. The series recorded so far are kept."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    """Return whether metrics are being recorded."""
+    return _enabled
+
+
+def count(name: str, amount: float = 1, **labels: str) -> None:
+    """Add amount to the counter foodfinder_{name}_total with the given labels, if metrics
+    are enabled.
+    """
+    if _enabled:
+        registry.inc(f'foodfinder_{name}_total', amount, **labels)
+
+
+class _StageTimer:
+    """Times one stage of a request, as a context manager."""
+    __slots__ = ('stage', 'start')
+    stage: str
+    start: float
+
+    def __init__(self, stage: str) -> None:
+        """Initialize a timer for the stage with the given name."""
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        """Start timing the stage."""
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Record the time spent in the stage."""
+        registry.observe('foodfinder_stage_seconds', time.perf_counter() - self.start,
+                         stage=self.stage)
+
+
+class _NoTimer:
+    """A context manager that does nothing, used while metrics are disabled."""
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        """Do nothing."""
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Do nothing."""
+
+
+_NO_TIMER = _NoTimer()
+
+
+def stage(name: str) -> ContextManager[None]:
+    """Return a context manager recording the time spent in it in the histogram
+    foodfinder_stage_seconds, labelled with the stage name, if metrics are enabled.
+    """
+    if _enabled:
+        return _StageTimer(name)
+    else:
+        return _NO_TIMER
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Return a decorator recording the time spent in every call of the decorated function
+    as the stage with the given name, if metrics are enabled.
+    """
+    def decorator(function: Callable) -> Callable:
+        """Wrap function with a stage timer."""
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _enabled:
+                return function(*args, **kwargs)
+
+            with _StageTimer(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class SamplingProfiler:
+    """Samples the call stack of one thread at a fixed interval from a background thread,
+    for profiling a single request without a tracing profiler's overhead.
+
+    The samples are reported in the folded format of flame graph tools: one line per
+    distinct stack, with the frames from outermost to innermost separated by semicolons,
+    followed by the number of samples of that stack.
+
+    Instance Attributes:
+        - thread_id: The id of the thread being sampled
+        - interval: The number of seconds between samples
+        - samples: The number of samples of each folded stack
+    """
+    thread_id: int
+    interval: float
+    samples: Counter
+
+    # Private Instance Attributes:
+    #   - _stopped: Set when sampling should stop
+    #   - _sampler: The thread taking the samples
+    _stopped: threading.Event
+    _sampler: Optional[threading.Thread]
+
+    def __init__(self, thread_id: int, interval: float = 0.001) -> None:
+        """Initialize a profiler for the thread with the given id."""
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def start(self) -> None:
+        """Start sampling in the background."""
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the last sample."""
+        self._stopped.set()
+
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _run(self) -> None:
+        """Take samples until the profiler is stopped."""
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                frame = frame.f_back
+
+            if len(stack) > 0:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """Return the samples in the folded stack format, most frequent first."""
+        return ''.join(f'{stack} {samples}\n' for stack, samples in self.samples.most_common())
+
+
+class ProfileStore:
+    """The folded stacks of the most recently profiled requests, by profile id.
+
+    Instance Attributes:
+        - maxsize: The maximum number of profiles kept
+    """
+    maxsize: int
+
+    # Private Instance Attributes:
+    #   - _profiles: Maps each profile id to its folded stacks, from oldest to newest
+    #   - _next_id: The id of the next profile
+    #   - _lock: The lock guarding the profiles
+    _profiles: OrderedDict[int, str]
+    _next_id: int
+    _lock: threading.Lock
+
+    def __init__(self, maxsize: int = 16) -> None:
+        """Initialize an empty store keeping at most maxsize profiles."""
+        self.maxsize = maxsize
+        self._profiles = OrderedDict()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def add(self, folded: str) -> int:
+        """Store a profile and return its id, dropping the oldest profile if needed."""
+        with self._lock:
+            profile_id = self._next_id
+            self._next_id += 1
+            self._profiles[profile_id] = folded
+
+            if len(self._profiles) > self.maxsize:
+                self._profiles.popitem(last=False)
+
+            return profile_id
+
+    def get(self, profile_id: int) -> Optional[str]:
+        """Return the profile with the given id, or None if it is not stored."""
+        with self._lock:
+            return self._profiles.get(profile_id)
@@ -0,0 +1,241 @@
+"""
+FoodFinder
+by Kenneth Tran
+
+Find similar foods approximately with MinHash signatures and locality-sensitive hashing,
+for catalogs too large to compare every pair of foods.
+
+Usage: python minhash.py [--queries QUERIES] [--limit LIMIT]
+
+Measures the recall and latency of the index against exact recommendations for several
+settings of the index, on random queries from the food choices dataset.
+"""
+
+import argparse
+import random
+import time
+from typing import Iterable
+
+import load
+import recommendation
+from graph import ComfortFoodGraph
+
+# A Mersenne prime larger than any vertex id, for the universal hash functions
+_PRIME = (1 << 61) - 1
+
+
+class MinHashIndex:
+    """An index of the foods of a ComfortFoodGraph by the MinHash signature of their users.
+
+    The signature of a food has `num_hashes` values, one minimum per hash function over the
+    ids of its users; two foods agree on each value with probability equal to the Jaccard
+    similarity of their users. The signatures are split into `bands` bands, and two foods are
+    candidates for each other if their signatures agree on every value of at least one band.
+
+    More bands (of fewer values each) find more of the similar foods, at the cost of more
+    candidates to rescore: foods with a Jaccard similarity of s are candidates with
+    probability 1 - (1 - s ** r) ** bands, where r is num_hashes // bands.
+
+    The similarities of the candidates are then computed exactly, so the index can be used as
+    the `engine` of recommendation.recommend_comfort_foods. The index is kept up to date as
+    new edges are added to the graph.
+
+    Instance Attributes:
+        - graph: The graph this index was built from
+        - num_hashes: The number of values in the signature of each food
+        - bands: The number of bands the signatures are split into
+    """
+    graph: ComfortFoodGraph
+    num_hashes: int
+    bands: int
+
+    # Private Instance Attributes:
+    #   - _coefficients: The (a, b) coefficients of the hash functions x -> (a * x + b) mod p
+    #   - _signatures: Maps each food id to its signature
+    #   - _buckets: Maps each band to the food ids whose signatures hash to each bucket
+    #   - _food_buckets: Maps each food id to its bucket in each band
+    #   - _stale: The ids of the foods whose signatures changed since they were bucketed
+    _coefficients: list[tuple[int, int]]
+    _signatures: dict[int, list[int]]
+    _buckets: list[dict[tuple[int, ...], set[int]]]
+    _food_buckets: dict[int, list[tuple[int, ...]]]
+    _stale: set[int]
+
+    def __init__(self, graph: ComfortFoodGraph, num_hashes: int = 128, bands: int = 64,
+                 seed: int = 0) -> None:
+        """Build the index of every food in graph, with hash functions drawn from seed.
+
+        Raise a ValueError if num_hashes is not a positive multiple of bands.
+        """
+        if bands <= 0 or num_hashes <= 0 or num_hashes % bands != 0:
+            raise ValueError
+
+        self.graph = graph
+        self.num_hashes = num_hashes
+        self.bands = bands
+
+        rng = random.Random(seed)
+        self._coefficients = [(rng.randrange(1, _PRIME), rng.randrange(_PRIME))
+                              for _ in range(num_hashes)]
+
+        self._signatures = {}
+        self._buckets = [{} for _ in range(bands)]
+        self._food_buckets = {}
+        self._stale = set()
+
+        for food in graph.get_foods():
+            food_id = graph.get_vertex_id(food)
+            self._signatures[food_id] = self._signature(graph.get_neighbour_ids(food_id))
+            self._bucket(food_id)
+
+        graph.add_edge_listener(self._add_edge)
+
+    def _signature(self, user_ids: Iterable[int]) -> list[int]:
+        """Return the MinHash signature of the given user ids."""
+        user_ids = list(user_ids)
+
+        if len(user_ids) == 0:
+            return [_PRIME] * self.num_hashes
+
+        return [min((a * user_id + b) % _PRIME for user_id in user_ids)
+                for a, b in self._coefficients]
+
+    def _bucket(self, food_id: int) -> None:
+        """Move the food with id food_id into the buckets of its current signature."""
+        for band, key in enumerate(self._food_buckets.get(food_id, [])):
+            self._buckets[band][key].discard(food_id)
+
+        signature = self._signatures[food_id]
+        rows = self.num_hashes // self.bands
+        keys = [tuple(signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, set()).add(food_id)
+
+        self._food_buckets[food_id] = keys
+
+    def _add_edge(self, user: str, food: str) -> None:
+        """Fold a new edge of the graph into the signature of its food."""
+        user_id = self.graph.get_vertex_id(user)
+        food_id = self.graph.get_vertex_id(food)
+        signature = self._signatures.setdefault(food_id, [_PRIME] * self.num_hashes)
+
+        for i, (a, b) in enumerate(self._coefficients):
+            signature[i] = min(signature[i], (a * user_id + b) % _PRIME)
+
+        # Rebucketing is deferred, since a batch of edges often touches the same food
+        self._stale.add(food_id)
+
+    def candidates(self, food: str) -> set[str]:
+        """Return the foods that share a bucket with food in at least one band, including
+        food itself.
+
+        Raise a ValueError if food is not a food vertex in the graph.
+        """
+        if self.graph.get_vertex_type(food) != 'food':
+            raise ValueError
+
+        return {self.graph.get_vertex_value(other_id) for other_id in self._candidate_ids(food)}
+
+    def _candidate_ids(self, food: str) -> set[int]:
+        """Return the ids of the foods that share a bucket with food in at least one band."""
+        for food_id in self._stale:
+            self._bucket(food_id)
+        self._stale.clear()
+
+        food_id = self.graph.get_vertex_id(food)
+        candidate_ids = set()
+
+        # Foods without any edges yet are in no bucket
+        for band, key in enumerate(self._food_buckets.get(food_id, [])):
+            candidate_ids.update(self._buckets[band][key])
+
+        return candidate_ids
+
+    def similarities(self, food: str) -> dict[str, float]:
+        """Return the exact Jaccard similarity between food and each of its candidates that
+        shares at least one user with it. Similar foods that are not candidates are missing,
+        as are foods with a similarity of 0.
+
+        Raise a ValueError if food is not a food vertex in the graph.
+        """
+        if self.graph.get_vertex_type(food) != 'food':
+            raise ValueError
+
+        food_id = self.graph.get_vertex_id(food)
+        users = set(self.graph.get_neighbour_ids(food_id))
+        similarities = {}
+
+        for other_id in self._candidate_ids(food):
+            other_users = self.graph.get_neighbour_ids(other_id)
+            intersection = sum(1 for user_id in other_users if user_id in users)
+
+            if intersection > 0:
+                similarities[self.graph.get_vertex_value(other_id)] = \
+                    intersection / (len(users) + len(other_users) - intersection)
+
+        return similarities
+
+
+def measure_recall(graph: ComfortFoodGraph, index: MinHashIndex,
+                   queries: list[tuple[str, set[str]]], limit: int) -> dict[str, float]:
+    """Return the mean recall of the recommendations made with index against the exact
+    recommendations of recommendation.recommend_comfort_foods for the given queries, along
+    with the mean latency of both in milliseconds.
+
+    The recall of a query is the fraction of its exact recommendations that are also
+    recommended with the index (1 if there are no exact recommendations).
+    """
+    total_recall = 0.0
+    exact_time = 0.0
+    approximate_time = 0.0
+
+    for keyword, liked_foods in queries:
+        start = time.perf_counter()
+        exact = recommendation.recommend_comfort_foods(graph, keyword, liked_foods, limit)
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        approximate = recommendation.recommend_comfort_foods(graph, keyword, liked_foods, limit,
+                                                             index)
+        approximate_time += time.perf_counter() - start
+
+        if len(exact) == 0:
+            total_recall += 1
+        else:
+            total_recall += len(set(exact).intersection(approximate)) / len(exact)
+
+    return {
+        'recall': total_recall / len(queries),
+        'exact_ms': exact_time / len(queries) * 1000,
+        'approximate_ms': approximate_time / len(queries) * 1000
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the recall of the MinHash index.')
+    parser.add_argument('--queries', type=int, default=200, help='number of random queries')
+    parser.add_argument('--limit', type=int, default=5,
+                        help='number of recommendations per query')
+    parser.add_argument('--dataset', default='data/food_choices_clean.csv',
+                        help='food choices dataset file')
+    args = parser.parse_args()
+
+    comfort_graph = load.load_comfort_food_graph_cached(args.dataset)
+
+    query_rng = random.Random(0)
+    all_foods = sorted(comfort_graph.get_foods())
+    all_reasons = sorted(comfort_graph.get_all_reasons())
+    random_queries = [(query_rng.choice(all_reasons),
+                       set(query_rng.sample(all_foods, query_rng.randint(1, 3))))
+                      for _ in range(args.queries)]
+
+    for hashes, num_bands in [(128, 16), (128, 32), (128, 64), (128, 128)]:
+        start_time = time.perf_counter()
+        minhash_index = MinHashIndex(comfort_graph, hashes, num_bands)
+        build_ms = (time.perf_counter() - start_time) * 1000
+
+        result = measure_recall(comfort_graph, minhash_index, random_queries, args.limit)
+        print(f'{hashes} hashes, {num_bands} bands: recall {result["recall"]:.3f}, '
+              f'{result["approximate_ms"]:.2f} ms per query (exact '
+              f'{result["exact_ms"]:.2f} ms), built in {build_ms:.0f} ms')
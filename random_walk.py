@@ -0,0 +1,163 @@
+"""
+FoodFinder
+by Kenneth Tran
+
+Recommend foods by a random walk with restart on the user-food graph.
+"""
+
+import time
+
+from cache import PartialScores
+from graph import ComfortFoodGraph
+
+
+class RandomWalkRecommender:
+    """Scores foods by personalized PageRank: the probability of ending up at each food in
+    a random walk that starts from the liked foods and jumps back to them with probability
+    `restart` at every step.
+
+    Unlike neighbour overlap, the walk reaches foods that share no user with the liked foods.
+    At each step, the walk follows an edge whose reasons include the keyword
+    `keyword_weight` times more often than any other edge of the same vertex.
+
+    The probabilities are computed by power iteration over the sparse adjacency of the
+    graph, only ever touching the vertices the walk reached. The edges with the keyword are
+    found by their reason mask ids, so the keyword needs no index of its own. The iteration
+    stops early once the probabilities change by less than `tolerance` in total, or after
+    `max_iterations` steps, or once the query has run for `time_budget` seconds, which is
+    checked before each vertex is visited. Since the scores of a walk cut short by its time
+    budget depend on how busy the machine was, they are returned as PartialScores so that
+    they are not cached.
+
+    Instance Attributes:
+        - graph: The graph to recommend foods from
+        - restart: The probability of jumping back to the liked foods at each step
+        - keyword_weight: How much more likely the walk is to follow an edge with the keyword
+        - tolerance: The total change in probability below which the walk has converged
+        - max_iterations: The maximum number of steps of the power iteration
+        - time_budget: The maximum number of seconds to spend on one query
+    """
+    graph: ComfortFoodGraph
+    restart: float
+    keyword_weight: float
+    tolerance: float
+    max_iterations: int
+    time_budget: float
+
+    # Private Instance Attributes:
+    #   - _version: The version of the graph the food ids and keyword mask ids were found in
+    #   - _food_ids: The ids of the food vertices of the graph
+    #   - _keyword_mask_ids: Maps each keyword to the reason mask ids of the edges with that
+    #       keyword as a reason
+    _version: int
+    _food_ids: frozenset[int]
+    _keyword_mask_ids: dict[str, frozenset[int]]
+
+    def __init__(self, graph: ComfortFoodGraph, restart: float = 0.3,
+                 keyword_weight: float = 2.0, tolerance: float = 1e-6,
+                 max_iterations: int = 30, time_budget: float = 0.05) -> None:
+        """Initialize a recommender for graph.
+
+        Raise a ValueError if restart is not between 0 (exclusive) and 1 (inclusive), or if
+        keyword_weight is not positive.
+        """
+        if not 0 < restart <= 1 or keyword_weight <= 0:
+            raise ValueError
+
+        self.graph = graph
+        self.restart = restart
+        self.keyword_weight = keyword_weight
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.time_budget = time_budget
+        self._version = graph.version
+        self._food_ids = frozenset(map(graph.get_vertex_id, graph.get_foods()))
+        self._keyword_mask_ids = {}
+
+    def score(self, keyword: str, liked_foods: set[str]) -> dict[str, float]:
+        """Return the probability of the walk from `liked_foods` ending at every food it
+        reaches, excluding the liked foods themselves. The scores are PartialScores if the
+        walk ran out of time before it converged.
+
+        Raise a ValueError if any liked food is not a vertex in the graph.
+        """
+        deadline = time.perf_counter() + self.time_budget
+
+        if self._version != self.graph.version:
+            self._version = self.graph.version
+            self._food_ids = frozenset(map(self.graph.get_vertex_id, self.graph.get_foods()))
+            self._keyword_mask_ids.clear()
+
+        liked_ids = {self.graph.get_vertex_id(liked_food) for liked_food in liked_foods}
+        probabilities, out_of_time = self._walk(keyword, liked_ids, deadline)
+
+        scores = {}
+
+        # Visit the foods in the order they were added to the graph, so ties stay in that order
+        for vertex_id in sorted(probabilities.keys() & self._food_ids):
+            if vertex_id not in liked_ids and probabilities[vertex_id] > 0:
+                scores[self.graph.get_vertex_value(vertex_id)] = probabilities[vertex_id]
+
+        if out_of_time:
+            return PartialScores(scores)
+
+        return scores
+
+    def _walk(self, keyword: str, seed_ids: set[int], deadline: float) \
+            -> tuple[dict[int, float], bool]:
+        """Return the probability of the walk restarting at seed_ids ending at each vertex id
+        it reaches, and whether the walk ran past deadline (a time.perf_counter value) before
+        it converged, in which case the probabilities of its last complete step are returned.
+        """
+        keyword_mask_ids = self._get_keyword_mask_ids(keyword)
+        is_keyword_mask_id = keyword_mask_ids.__contains__
+        extra_weight = self.keyword_weight - 1
+        follow = 1 - self.restart
+
+        seed = {seed_id: 1 / len(seed_ids) for seed_id in seed_ids}
+        probabilities = dict(seed)
+
+        for _ in range(self.max_iterations):
+            next_probabilities = {seed_id: self.restart * mass for seed_id, mass in seed.items()}
+
+            for vertex_id, mass in probabilities.items():
+                if time.perf_counter() > deadline:
+                    return probabilities, True
+
+                neighbour_ids = self.graph.get_neighbour_ids(vertex_id)
+
+                # A walk at a vertex without neighbours jumps back to the liked foods
+                if len(neighbour_ids) == 0:
+                    for seed_id, seed_mass in seed.items():
+                        next_probabilities[seed_id] += follow * mass * seed_mass
+                    continue
+
+                mask_ids = self.graph.get_neighbour_mask_ids(vertex_id)
+                keyword_degree = sum(map(is_keyword_mask_id, mask_ids))
+                step = follow * mass / (len(neighbour_ids) + extra_weight * keyword_degree)
+                keyword_step = step * self.keyword_weight
+
+                for neighbour_id, mask_id in zip(neighbour_ids, mask_ids):
+                    next_probabilities[neighbour_id] = next_probabilities.get(neighbour_id, 0) \
+                        + (keyword_step if mask_id in keyword_mask_ids else step)
+
+            if time.perf_counter() > deadline:
+                return next_probabilities, True
+
+            change = sum(abs(mass - probabilities.get(vertex_id, 0))
+                         for vertex_id, mass in next_probabilities.items())
+            probabilities = next_probabilities
+
+            if change < self.tolerance:
+                break
+
+        return probabilities, False
+
+    def _get_keyword_mask_ids(self, keyword: str) -> frozenset[int]:
+        """Return the reason mask ids of the edges with keyword as a reason, finding them
+        first if they are not known yet.
+        """
+        if keyword not in self._keyword_mask_ids:
+            self._keyword_mask_ids[keyword] = self.graph.get_mask_ids_with_reason(keyword)
+
+        return self._keyword_mask_ids[keyword]
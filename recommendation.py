@@ -5,43 +5,140 @@ by Kenneth Tran
 Calculate recommendations and any related data.
 """
 
+from __future__ import annotations
+
+import heapq
+from typing import Collection, Optional, Union, TYPE_CHECKING
+
+import metrics
 from graph import ComfortFoodGraph
+from similarity import SimilarityEngine, SimilarityTable
+from warmup import WarmupTable
+
+if TYPE_CHECKING:
+    from minhash import MinHashIndex
 
 
 def recommend_comfort_foods(graph: ComfortFoodGraph, keyword: str, liked_foods: set[str],
-                            limit: int) -> list[str]:
+                            limit: int,
+                            engine: Optional[Union[SimilarityEngine, SimilarityTable,
+                                                   MinHashIndex, WarmupTable]] = None,
+                            offset: int = 0) -> list[str]:
     """Given a keyword and a set of liked foods, recommend a list of foods of at most
     length `limit` that do not contain any foods in the original set of foods.
+
+    If `offset` is given, the first `offset` recommendations are skipped, so that further
+    pages of recommendations can be fetched.
+
+    If `engine` is given, the similarities are computed in bulk by the engine (or looked up
+    in a precomputed similarity table) instead of pair by pair. The recommendations are the
+    same either way, except with a MinHashIndex, which only finds most of the similar foods.
+    With a WarmupTable, the recommendations for a single liked food are merged from its
+    precomputed lists instead of being scored.
     """
+    if isinstance(engine, WarmupTable) and len(liked_foods) == 1:
+        return engine.recommend(keyword, next(iter(liked_foods)), limit, offset)
+
+    scores = score_comfort_foods(graph, keyword, liked_foods, engine)
+    return select_top(scores, limit, offset)
+
+
+def score_comfort_foods(graph: ComfortFoodGraph, keyword: str, liked_foods: set[str],
+                        engine: Optional[Union[SimilarityEngine, SimilarityTable,
+                                               MinHashIndex, WarmupTable]] = None) \
+        -> dict[str, float]:
+    """Return the recommendation score of every food that is similar to at least one food in
+    `liked_foods`, excluding the liked foods themselves.
+
+    Pass the scores to select_top to get the recommendations; since the scores do not depend
+    on the page of recommendations, they can be kept to fetch further pages.
+    """
+    # Get foods that at least one user is connected to with the given keyword (reason)
+    with metrics.stage('reason_scan'):
+        foods_with_reasons = get_foods_with_reasons(graph, {keyword})
+
+    # Compute the similarities between each liked food and every other food at once
+    if engine is not None:
+        with metrics.stage('similarity_scoring'):
+            liked_similarities = {liked_food: engine.similarities(liked_food)
+                                  for liked_food in liked_foods}
+            return score_from_similarities(graph, liked_foods, liked_similarities,
+                                           foods_with_reasons)
+
     recommended_foods = {}
 
     # Get all foods
     all_foods = graph.get_foods()
 
-    # Get foods that at least one user is connected to with the given keyword (reason)
-    foods_with_reasons = get_foods_with_reasons(graph, {keyword})
+    with metrics.stage('similarity_scoring'):
+        for food in all_foods:
+            for liked_food in liked_foods:
+                # Ignore foods that were already in `liked_foods`
+                if food not in liked_foods:
+                    # Compare similarity between each liked food and potential foods to
+                    # recommend
+                    sim = get_similarity(graph, food, liked_food)
+
+                    # Get the highest sim score between food and any liked food
+                    new_score = max(recommended_foods.get(food, 0), sim)
 
-    for food in all_foods:
+                    # Prioritize foods that are associated with the given reasons
+                    if food in foods_with_reasons:
+                        new_score += 5
+
+                    if sim > 0:
+                        recommended_foods[food] = new_score
+
+    return recommended_foods
+
+
+def score_from_similarities(graph: ComfortFoodGraph, liked_foods: Collection[str],
+                            liked_similarities: dict[str, dict[str, float]],
+                            foods_with_reasons: set[str]) -> dict[str, float]:
+    """Return the same scores as score_comfort_foods, given the similarities between each
+    liked food and the foods similar to it, and the foods associated with the keyword.
+
+    Only the foods with a nonzero similarity to some liked food are visited, in the order of
+    graph.get_foods(), so the scores (and the order of ties) are the same as visiting every
+    food in the graph. The liked foods are visited in the order of `liked_foods`.
+    """
+    recommended_foods = {}
+
+    candidates = set()
+    for similarities in liked_similarities.values():
+        candidates.update(similarities)
+
+    # Food ids follow the order in which the foods were added to the graph
+    for food in sorted(candidates.difference(liked_foods), key=graph.get_vertex_id):
         for liked_food in liked_foods:
-            # Ignore foods that were already in `liked_foods`
-            if food not in liked_foods:
-                # Compare similarity between each liked food and potential foods to recommend
-                sim = get_similarity(graph, food, liked_food)
+            sim = liked_similarities[liked_food].get(food, 0)
+
+            # Get the highest sim score between food and any liked food
+            new_score = max(recommended_foods.get(food, 0), sim)
+
+            # Prioritize foods that are associated with the given reasons
+            if food in foods_with_reasons:
+                new_score += 5
 
-                # Get the highest sim score between food and any liked food
-                new_score = max(recommended_foods.get(food, 0), sim)
+            if sim > 0:
+                recommended_foods[food] = new_score
 
-                # Prioritize foods that are associated with the given reasons
-                if food in foods_with_reasons:
-                    new_score += 5
+    return recommended_foods
 
-                if sim > 0:
-                    recommended_foods[food] = new_score
 
-    # Sort by descending order
-    sorted_recs = sorted(recommended_foods, key=recommended_foods.get, reverse=True)
+def select_top(scores: dict[str, float], limit: int, offset: int = 0) -> list[str]:
+    """Return the foods ranked offset + 1 to offset + limit by descending score.
+
+    The foods are selected in a single pass with a heap of size offset + limit, rather than
+    by sorting all the scores. Foods with equal scores stay in the order of `scores`.
+
+    >>> select_top({'Pizza': 0.5, 'Chips': 5.2, 'Soup': 0.5, 'Tea': 0.1}, 2, offset=1)
+    ['Pizza', 'Soup']
+    """
+    metrics.count('recommendation_candidates', len(scores))
 
-    return sorted_recs[:limit]
+    # heapq.nlargest is stable, just like sorting in descending order
+    return heapq.nlargest(offset + limit, scores, key=scores.get)[offset:]
 
 
 def get_similarity(graph: ComfortFoodGraph, food1: str, food2: str) -> float:
@@ -68,9 +165,7 @@ def get_foods_with_reasons(graph: ComfortFoodGraph, reasons: set[str]) -> set[st
     """
     foods_so_far = set()
 
-    for user in graph.get_users():
-        for food in graph.get_neighbours(user):
-            if any(reason in graph.get_reasons(user, food) for reason in reasons):
-                foods_so_far.add(food)
+    for reason in reasons:
+        foods_so_far.update(graph.get_foods_with_reason(reason))
 
     return foods_so_far
@@ -0,0 +1,258 @@
+"""
+FoodFinder
+by Kenneth Tran
+
+A pluggable pipeline of weighted scoring signals for recommendations.
+
+Every signal is a Scorer that scores all the candidate foods for one liked food at once,
+from the same precomputed incidence data. The co-occurrence rows of that data are read from
+a SimilarityTable when one is given. The pipeline adds up the weighted signals and
+keeps the best score of each candidate over all the liked foods.
+"""
+
+import math
+from collections import Counter
+from typing import Optional
+
+from graph import ComfortFoodGraph
+from similarity import SimilarityTable
+
+
+class Incidence:
+    """The food-user incidence data of a ComfortFoodGraph that the scorers share.
+
+    Instance Attributes:
+        - graph: The graph of this incidence data
+        - version: The version of the graph this data was computed from
+        - degrees: The number of neighbours of every vertex of the graph, indexed by id
+        - table: The similarity table of the graph to read co-occurrences from, if any
+    """
+    graph: ComfortFoodGraph
+    version: int
+    degrees: list[int]
+    table: Optional[SimilarityTable]
+
+    # Private Instance Attributes:
+    #   - _co_occurrences: Maps each food id to its row of co-occurrences, computed on first
+    #       use
+    #   - _reason_counts: Maps each reason to the number of edges of each food id with that
+    #       reason, computed on first use
+    _co_occurrences: dict[int, Counter]
+    _reason_counts: dict[str, Counter]
+
+    def __init__(self, graph: ComfortFoodGraph, table: Optional[SimilarityTable] = None) -> None:
+        """Compute the incidence data of graph, reading co-occurrences from table if it is
+        given.
+        """
+        self.graph = graph
+        self.version = graph.version
+        self.degrees = graph.get_degrees().tolist()
+        self.table = table
+        self._co_occurrences = {}
+        self._reason_counts = {}
+
+    def co_occurrences(self, food_id: int) -> Counter:
+        """Return the number of users each food id shares with the food with id food_id
+        (the row food_id of A * A^T, where A is the food-user incidence matrix).
+
+        The returned counter is shared between queries and must not be changed.
+        """
+        if food_id not in self._co_occurrences:
+            if self.table is not None:
+                row = self.table.intersections(self.graph.get_vertex_value(food_id))
+                intersections = Counter({self.graph.get_vertex_id(food): intersection
+                                         for food, intersection in row.items()})
+            else:
+                intersections = Counter()
+                for user_id in self.graph.get_neighbour_ids(food_id):
+                    intersections.update(self.graph.get_neighbour_ids(user_id))
+
+            self._co_occurrences[food_id] = intersections
+
+        return self._co_occurrences[food_id]
+
+    def reason_counts(self, reason: str) -> Counter:
+        """Return the number of edges with the given reason of each food id."""
+        if reason not in self._reason_counts:
+            counts = Counter()
+
+            for user in self.graph.get_users_with_reason(reason):
+                for food in self.graph.get_neighbours(user):
+                    if reason in self.graph.get_reasons(user, food):
+                        counts[self.graph.get_vertex_id(food)] += 1
+
+            self._reason_counts[reason] = counts
+
+        return self._reason_counts[reason]
+
+
+class Scorer:
+    """A signal scoring how good a recommendation each candidate food is for someone who
+    likes some food.
+
+    This is an abstract class: subclasses implement score.
+    """
+    def score(self, incidence: Incidence, keyword: str, liked_id: int,
+              co_occurrences: Counter) -> dict[int, float]:
+        """Return the score of every candidate food id for the liked food with id liked_id,
+        where co_occurrences is incidence.co_occurrences(liked_id). The candidates are the
+        foods that share at least one user with the liked food; missing candidates score 0.
+        """
+        raise NotImplementedError
+
+
+class JaccardScorer(Scorer):
+    """The Jaccard similarity between the users of the liked food and of each candidate."""
+    def score(self, incidence: Incidence, keyword: str, liked_id: int,
+              co_occurrences: Counter) -> dict[int, float]:
+        """Return the Jaccard similarity of every candidate with the liked food."""
+        degrees = incidence.degrees
+        return {food_id: intersection / (degrees[liked_id] + degrees[food_id] - intersection)
+                for food_id, intersection in co_occurrences.items()}
+
+
+class CosineScorer(Scorer):
+    """The cosine similarity between the user vectors of the liked food and each candidate."""
+    def score(self, incidence: Incidence, keyword: str, liked_id: int,
+              co_occurrences: Counter) -> dict[int, float]:
+        """Return the cosine similarity of every candidate with the liked food."""
+        degrees = incidence.degrees
+        return {food_id: intersection / math.sqrt(degrees[liked_id] * degrees[food_id])
+                for food_id, intersection in co_occurrences.items()}
+
+
+class AdamicAdarScorer(Scorer):
+    """The Adamic-Adar index of the liked food and each candidate: users they share count
+    for more when those users like fewer foods.
+    """
+    def score(self, incidence: Incidence, keyword: str, liked_id: int,
+              co_occurrences: Counter) -> dict[int, float]:
+        """Return the Adamic-Adar index of every candidate with the liked food."""
+        graph = incidence.graph
+        scores = dict.fromkeys(co_occurrences, 0.0)
+
+        for user_id in graph.get_neighbour_ids(liked_id):
+            # A shared user likes at least two foods, so the logarithm is positive
+            degree = incidence.degrees[user_id]
+            if degree > 1:
+                weight = 1 / math.log(degree)
+                for food_id in graph.get_neighbour_ids(user_id):
+                    scores[food_id] += weight
+
+        return scores
+
+
+class ReasonOverlapScorer(Scorer):
+    """The fraction of the users of each candidate who like it for the keyword."""
+    def score(self, incidence: Incidence, keyword: str, liked_id: int,
+              co_occurrences: Counter) -> dict[int, float]:
+        """Return the fraction of the edges of every candidate with the keyword as a
+        reason.
+        """
+        counts = incidence.reason_counts(keyword)
+        return {food_id: counts[food_id] / incidence.degrees[food_id]
+                for food_id in co_occurrences}
+
+
+class KeywordBonusScorer(Scorer):
+    """1 for each candidate with at least one edge with the keyword.
+
+    Unlike the bonus of recommendation.score_comfort_foods, which is added once for every
+    liked food the candidate is compared with, this bonus is weighted once per liked food and
+    the pipeline keeps the best score over the liked foods, so it never adds up.
+    """
+    def score(self, incidence: Incidence, keyword: str, liked_id: int,
+              co_occurrences: Counter) -> dict[int, float]:
+        """Return 1 for every candidate associated with the keyword, and 0 otherwise."""
+        counts = incidence.reason_counts(keyword)
+        return {food_id: 1.0 if counts[food_id] > 0 else 0.0 for food_id in co_occurrences}
+
+
+# The scorers that can be named in the weights of a ScoringPipeline
+SCORERS = {
+    'jaccard': JaccardScorer,
+    'cosine': CosineScorer,
+    'adamic_adar': AdamicAdarScorer,
+    'reason_overlap': ReasonOverlapScorer,
+    'keyword_bonus': KeywordBonusScorer
+}
+
+# The weights of the default pipeline: Jaccard similarity with a bonus for the keyword. With
+# a single liked food, this scores like recommendation.score_comfort_foods; with several, the
+# bonus is not added once per liked food, so the rankings can differ
+DEFAULT_WEIGHTS = {'jaccard': 1.0, 'keyword_bonus': 5.0}
+
+
+class ScoringPipeline:
+    """Scores recommendations as a weighted sum of signals.
+
+    For each liked food, every candidate food gets the weighted sum of the scores of the
+    scorers; its final score is its best weighted sum over all the liked foods.
+
+    Instance Attributes:
+        - graph: The graph to recommend foods from
+        - scorers: The scorers of this pipeline with their weights
+        - table: The similarity table of the graph to read co-occurrences from, if any
+    """
+    graph: ComfortFoodGraph
+    scorers: list[tuple[Scorer, float]]
+    table: Optional[SimilarityTable]
+
+    # Private Instance Attributes:
+    #   - _incidence: The incidence data of the graph, recomputed when the graph changes
+    _incidence: Incidence
+
+    def __init__(self, graph: ComfortFoodGraph, weights: Optional[dict[str, float]] = None,
+                 table: Optional[SimilarityTable] = None) -> None:
+        """Initialize a pipeline for graph with the scorers named in weights (by default,
+        DEFAULT_WEIGHTS). Scorers with a weight of 0 are left out. If table is given, the
+        co-occurrences of the liked foods are read from it instead of from the graph.
+
+        Raise a ValueError if weights names a scorer that is not in SCORERS, or if table is
+        not a table of graph.
+        """
+        if weights is None:
+            weights = DEFAULT_WEIGHTS
+
+        if any(name not in SCORERS for name in weights) or \
+                (table is not None and table.graph is not graph):
+            raise ValueError
+
+        self.graph = graph
+        self.scorers = [(SCORERS[name](), weight) for name, weight in weights.items()
+                        if weight != 0]
+        self.table = table
+        self._incidence = Incidence(graph, table)
+
+    def add_scorer(self, scorer: Scorer, weight: float) -> None:
+        """Add another scorer with the given weight to this pipeline."""
+        self.scorers.append((scorer, weight))
+
+    def score(self, keyword: str, liked_foods: set[str]) -> dict[str, float]:
+        """Return the score of every food that shares a user with at least one food in
+        `liked_foods`, excluding the liked foods themselves and foods that score 0.
+
+        Raise a ValueError if any liked food is not a vertex in the graph.
+        """
+        if self._incidence.version != self.graph.version:
+            self._incidence = Incidence(self.graph, self.table)
+
+        liked_ids = {self.graph.get_vertex_id(liked_food) for liked_food in liked_foods}
+        scores = {}
+
+        for liked_id in liked_ids:
+            co_occurrences = self._incidence.co_occurrences(liked_id)
+            combined = dict.fromkeys(co_occurrences, 0.0)
+
+            for scorer, weight in self.scorers:
+                for food_id, score in scorer.score(self._incidence, keyword, liked_id,
+                                                   co_occurrences).items():
+                    combined[food_id] += weight * score
+
+            for food_id, score in combined.items():
+                if food_id not in liked_ids:
+                    scores[food_id] = max(scores.get(food_id, 0), score)
+
+        # Visit the foods in the order they were added to the graph, so ties stay in that order
+        return {self.graph.get_vertex_value(food_id): scores[food_id]
+                for food_id in sorted(scores) if scores[food_id] > 0}
@@ -0,0 +1,206 @@
+"""
+FoodFinder
+by Kenneth Tran
+
+Compute food similarities in bulk from a sparse food-user incidence matrix.
+"""
+
+from __future__ import annotations
+
+from array import array
+from collections import Counter
+
+from graph import ComfortFoodGraph
+
+
+class SimilarityEngine:
+    """Computes the Jaccard similarity between a food and every other food in one pass.
+
+    The adjacency of a ComfortFoodGraph is stored in CSR form, so it is the food-user
+    incidence matrix A indexed both by food (food -> users) and by user (user -> foods). The
+    intersection sizes between one food and all others are the row of the sparse product
+    A * A^T, which is accumulated by walking the users of the food. Together with a
+    precomputed degree vector this gives every Jaccard score without building any
+    neighbour sets.
+
+    Instance Attributes:
+        - graph: The graph this engine was built from
+    """
+    graph: ComfortFoodGraph
+
+    # Private Instance Attributes:
+    #   - _version: The version of the graph the degree vector was computed from
+    #   - _degrees: The number of neighbours of every vertex of the graph, indexed by id
+    _version: int
+    _degrees: array
+
+    def __init__(self, graph: ComfortFoodGraph) -> None:
+        """Build the degree vector of graph."""
+        self.graph = graph
+        self._build()
+
+    def _build(self) -> None:
+        """(Re)build the degree vector from the current state of the graph."""
+        version = self.graph.version
+        self._degrees = self.graph.get_degrees()
+
+        # Readers only skip rebuilding once the version is set, so it is set last
+        self._version = version
+
+    def similarities(self, food: str) -> dict[str, float]:
+        """Return the Jaccard similarity between food and every food that shares at least
+        one user with it. Foods that are missing have a similarity of 0.
+
+        The scores are equal to recommendation.get_similarity(self.graph, food, other).
+
+        The degree vector is rebuilt first if the graph changed since it was built.
+
+        Raise a ValueError if food is not a food vertex in the graph.
+
+        >>> from recommendation import get_similarity
+        >>> graph = ComfortFoodGraph()
+        >>> graph.add_users([('User #0', ['Pizza', 'Chips'], ['Stress']),
+        ...                  ('User #1', ['Pizza'], ['Boredom']),
+        ...                  ('User #2', ['Chips', 'Soup'], ['Stress'])])
+        >>> engine = SimilarityEngine(graph)
+        >>> sorted(engine.similarities('Chips').items())
+        [('Chips', 1.0), ('Pizza', 0.3333333333333333), ('Soup', 0.5)]
+        >>> all(engine.similarities(food).get(other, 0) == get_similarity(graph, food, other)
+        ...     for food in graph.get_foods() for other in graph.get_foods())
+        True
+        """
+        if self._version != self.graph.version:
+            self._build()
+
+        if self.graph.get_vertex_type(food) != 'food':
+            raise ValueError
+
+        food_id = self.graph.get_vertex_id(food)
+        degree = self._degrees[food_id]
+
+        # Row food_id of A * A^T: the number of users each other food shares with food
+        intersections = Counter()
+        for user_id in self.graph.get_neighbour_ids(food_id):
+            intersections.update(self.graph.get_neighbour_ids(user_id))
+
+        return {self.graph.get_vertex_value(other_id):
+                intersection / (degree + self._degrees[other_id] - intersection)
+                for other_id, intersection in intersections.items()}
+
+
+class SimilarityTable:
+    """A precomputed table of the Jaccard similarity between every pair of foods that share
+    at least one user.
+
+    The table is computed once when it is created and then kept up to date as new edges
+    are added to the graph, so it never needs to be rebuilt.
+
+    Instance Attributes:
+        - graph: The graph this table was built from
+    """
+    graph: ComfortFoodGraph
+
+    # Private Instance Attributes:
+    #   - _intersections: Maps each pair of foods to the number of users they share (a food
+    #       shares all of its users with itself)
+    #   - _rows: Maps each pair of foods to their Jaccard similarity
+    _intersections: dict[str, dict[str, int]]
+    _rows: dict[str, dict[str, float]]
+
+    def __init__(self, graph: ComfortFoodGraph) -> None:
+        """Compute the similarity table of graph and start tracking its new edges."""
+        self.graph = graph
+        self._intersections = {food: {} for food in graph.get_foods()}
+
+        # Every user adds one to the intersection of each pair of their foods
+        for user in graph.get_users():
+            foods = graph.get_neighbours(user)
+
+            for food in foods:
+                row = self._intersections[food]
+                for other in foods:
+                    row[other] = row.get(other, 0) + 1
+
+        self._rows = {food: {} for food in self._intersections}
+        for food in self._intersections:
+            self._update_row(food)
+
+        graph.add_edge_listener(self._add_edge)
+
+    def copy(self, graph: ComfortFoodGraph) -> SimilarityTable:
+        """Return a copy of this table that tracks the new edges of graph instead, where graph
+        is a copy of self.graph (see ComfortFoodGraph.copy).
+        """
+        table = SimilarityTable.__new__(SimilarityTable)
+        table.graph = graph
+        table._intersections = {food: row.copy() for food, row in self._intersections.items()}
+        table._rows = {food: row.copy() for food, row in self._rows.items()}
+
+        graph.add_edge_listener(table._add_edge)
+
+        return table
+
+    def similarities(self, food: str) -> dict[str, float]:
+        """Return the Jaccard similarity between food and every food that shares at least
+        one user with it. Foods that are missing have a similarity of 0.
+
+        The scores are equal to recommendation.get_similarity(self.graph, food, other).
+        The returned dictionary is part of this table and must not be changed.
+
+        Raise a ValueError if food is not a food vertex in the graph.
+
+        >>> from recommendation import get_similarity
+        >>> graph = ComfortFoodGraph()
+        >>> graph.add_users([('User #0', ['Pizza', 'Chips'], ['Stress']),
+        ...                  ('User #1', ['Pizza'], ['Boredom'])])
+        >>> table = SimilarityTable(graph)
+        >>> graph.add_users([('User #2', ['Chips', 'Soup'], ['Stress'])])
+        >>> sorted(table.similarities('Chips').items())
+        [('Chips', 1.0), ('Pizza', 0.3333333333333333), ('Soup', 0.5)]
+        >>> all(table.similarities(food).get(other, 0) == get_similarity(graph, food, other)
+        ...     for food in graph.get_foods() for other in graph.get_foods())
+        True
+        """
+        if self.graph.get_vertex_type(food) != 'food':
+            raise ValueError
+
+        return self._rows.get(food, {})
+
+    def intersections(self, food: str) -> dict[str, int]:
+        """Return the number of users food shares with every food that shares at least one
+        user with it, including food itself. Foods that are missing share no users.
+
+        The returned dictionary is part of this table and must not be changed.
+
+        Raise a ValueError if food is not a food vertex in the graph.
+        """
+        if self.graph.get_vertex_type(food) != 'food':
+            raise ValueError
+
+        return self._intersections.get(food, {})
+
+    def _add_edge(self, user: str, food: str) -> None:
+        """Update the table after a new edge between user and food was added to the graph."""
+        row = self._intersections.setdefault(food, {})
+        self._rows.setdefault(food, {})
+
+        for other in self.graph.get_neighbours(user):
+            row[other] = row.get(other, 0) + 1
+
+            if other != food:
+                self._intersections[other][food] = row[other]
+
+        # The degree of food changed, so its whole row (and column) of similarities changed
+        self._update_row(food)
+
+    def _update_row(self, food: str) -> None:
+        """Recompute the similarities between food and every food it shares a user with, in
+        both directions.
+        """
+        row = self._intersections[food]
+        degree = row.get(food, 0)
+
+        for other, intersection in row.items():
+            sim = intersection / (degree + self._intersections[other][other] - intersection)
+            self._rows[food][other] = sim
+            self._rows[other][food] = sim
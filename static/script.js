@@ -3,11 +3,33 @@ function handleFlash(message) {
         alert(message);
 }
 
+// Fetch a plotly figure as JSON, polling until the server has finished creating it
+function loadFigure(url, elementId) {
+    fetch(url).then(function(response) {
+        if (response.status == 202) {
+            setTimeout(function() { loadFigure(url, elementId); }, 500);
+        } else if (response.ok) {
+            response.json().then(function(figure) {
+                var element = document.getElementById(elementId);
+                element.innerHTML = '';
+                Plotly.newPlot(element, figure.data, figure.layout);
+            });
+        } else {
+            document.getElementById(elementId).innerHTML =
+                '<p>The visualization could not be created.</p>';
+        }
+    });
+}
+
 // Prevent enter submitting
-document.querySelector("form").onkeypress = function(e) {
-  var key = e.charCode || e.keyCode || 0;
+var form = document.querySelector("form");
+
+if (form) {
+  form.onkeypress = function(e) {
+    var key = e.charCode || e.keyCode || 0;
 
-  if (key == 13) {
-    e.preventDefault();
+    if (key == 13) {
+      e.preventDefault();
+    }
   }
 }
@@ -5,27 +5,129 @@ by Kenneth Tran
 Stores all the routes/views for the Flask app.
 """
 
+from __future__ import annotations
+
 import ast
-from typing import Optional, Any
+import threading
+import time
+from typing import Optional, Any, Union, TYPE_CHECKING
 
-from flask import Blueprint, render_template, request, url_for, redirect, flash
+from flask import Blueprint, render_template, request, url_for, redirect, flash, jsonify, \
+    Response, g
 
+import api
+import metrics
+from cache import RecommendationCache
 from graph import ComfortFoodGraph
-import visualization
-import recommendation
+from live import LiveComfortFoodGraph
+from random_walk import RandomWalkRecommender
+from scoring import ScoringPipeline
+from similarity import SimilarityEngine, SimilarityTable
+from warmup import WarmupTable
+
+if TYPE_CHECKING:
+    import visualization
+
+
+def construct_blueprint(comfort_graph: ComfortFoodGraph,
+                        engine: Optional[Union[SimilarityEngine, SimilarityTable]] = None,
+                        cache: Optional[RecommendationCache] = None,
+                        figures: Optional[visualization.FigureService] = None,
+                        scorer: Optional[Union[ScoringPipeline, RandomWalkRecommender]] = None,
+                        live: Optional[LiveComfortFoodGraph] = None,
+                        profiles: Optional[metrics.ProfileStore] = None,
+                        warmup: Optional[WarmupTable] = None) -> Blueprint:
+    """Return a Blueprint managing the comfort food views.
 
+    If `engine` is given, it is used to compute (or look up) the similarities for
+    recommendations. If `cache` is given, recommendations for repeated queries are served
+    from it. Figures are created by `figures`, or by a new FigureService if it is not given,
+    which is only created (and plotly only imported) when the first figure is requested.
+    If `scorer` is given, recommendations are scored by it instead of by
+    recommendation.score_comfort_foods. Otherwise, if `warmup` is given, the recommendations
+    for a single liked food are merged from its precomputed lists.
 
-def construct_blueprint(comfort_graph: ComfortFoodGraph) -> Blueprint:
-    """Return a Blueprint managing the comfort food views.
+    If `live` is given, every request is served from its current snapshot instead of from
+    `comfort_graph` and `engine`, and new respondents can be posted to /api/respondents.
+
+    While metrics are enabled (see metrics.enable), the latency of every request and of its
+    stages is recorded and served at /metrics. If `profiles` is also given, a request with
+    the X-Profile header is profiled by a sampling profiler; its response has an
+    X-Profile-Id header, and its folded stacks are served at /debug/profile/<id>.
+
+    Raise a ValueError if both `scorer` and `live` are given, since a scorer is bound to a
+    single graph.
     """
+    if scorer is not None and live is not None:
+        raise ValueError
+
     comfort_views = Blueprint('views', __name__, template_folder='templates')
 
+    def current() -> tuple[ComfortFoodGraph, Optional[Union[SimilarityEngine, SimilarityTable]]]:
+        """Return the graph and the engine to serve the current request from."""
+        if live is not None:
+            return live.snapshot()
+        else:
+            return comfort_graph, engine
+
+    def get_figures() -> visualization.FigureService:
+        """Return the figure service, creating it on first use."""
+        nonlocal figures
+
+        with figures_lock:
+            if figures is None:
+                import visualization
+                figures = visualization.FigureService()
+
+            return figures
+
+    @comfort_views.before_request
+    def start_request_metrics() -> None:
+        """Start timing the request, and start profiling it if it asks to be."""
+        if not metrics.is_enabled():
+            return
+
+        g.request_start = time.perf_counter()
+
+        if profiles is not None and 'X-Profile' in request.headers:
+            g.profiler = metrics.SamplingProfiler(threading.get_ident())
+            g.profiler.start()
+
+    @comfort_views.after_request
+    def record_request_metrics(response: Response) -> Response:
+        """Record the latency of the request, and store its profile if it was profiled."""
+        if 'request_start' not in g:
+            return response
+
+        profiler = g.pop('profiler', None)
+
+        if profiler is not None:
+            profiler.stop()
+            response.headers['X-Profile-Id'] = str(profiles.add(profiler.folded()))
+
+        metrics.registry.observe('foodfinder_request_seconds',
+                                 time.perf_counter() - g.request_start,
+                                 route=request.endpoint or '', status=str(response.status_code))
+        return response
+
+    @comfort_views.teardown_request
+    def stop_request_profiler(exception: Optional[BaseException]) -> None:
+        """Stop the profiler of the request if it is still running, which happens when the
+        request raised an exception that skipped record_request_metrics.
+        """
+        profiler = g.pop('profiler', None)
+
+        if profiler is not None:
+            profiler.stop()
+
+    figures_lock = threading.Lock()
+
     @comfort_views.route('/keywords')
     def choose_keywords() -> Any:
         """Route to select a keyword for comfort food.
         """
-        return render_template('choose-keyword.html',
-                               keywords=list(comfort_graph.get_all_reasons()))
+        graph, _ = current()
+        return _render('choose-keyword.html', keywords=list(graph.get_all_reasons()))
 
     @comfort_views.route('/foods')
     def choose_foods() -> Any:
@@ -39,9 +141,10 @@ def construct_blueprint(comfort_graph: ComfortFoodGraph) -> Blueprint:
             flash('Please enter a keyword.')
             return redirect(url_for('views.choose_keywords'))
 
-        return render_template('choose-foods.html',
-                               foods=list(comfort_graph.get_foods()),
-                               keyword=keyword)
+        graph, _ = current()
+        return _render('choose-foods.html',
+                       foods=list(graph.get_foods()),
+                       keyword=keyword)
 
     @comfort_views.route('/calculate-recommendations')
     def calculate_recommendations() -> Any:
@@ -77,11 +180,16 @@ def construct_blueprint(comfort_graph: ComfortFoodGraph) -> Blueprint:
         if food3 != '':
             foods.add(food3)
 
-        recommendations = recommendation.recommend_comfort_foods(comfort_graph, keyword, foods, 5)
+        # Fetch the page of recommendations to show, starting from the first one
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        graph, graph_engine = current()
+
+        recommendations = api.recommend(graph, keyword, foods, 5, offset, graph_engine, cache,
+                                        scorer, warmup)
 
         return redirect(url_for('views.display_recommendations',
                                 keyword=keyword, food1=food1, food2=food2, food3=food3,
-                                recommendations=','.join(recommendations)))
+                                recommendations=','.join(recommendations), offset=offset))
 
     @comfort_views.route('/recommendations')
     def display_recommendations() -> Any:
@@ -110,9 +218,11 @@ def construct_blueprint(comfort_graph: ComfortFoodGraph) -> Blueprint:
 
         # Fetch the recommendations argument
         recommendations = request.args['recommendations'].strip().split(',')
+        offset = max(request.args.get('offset', 0, type=int), 0)
 
-        return render_template('recommendations.html', keyword=keyword, food1=food1,
-                               food2=food2, food3=food3, recommendations=recommendations)
+        return _render('recommendations.html', keyword=keyword, food1=food1,
+                       food2=food2, food3=food3, recommendations=recommendations,
+                       offset=offset, page_size=5)
 
     @comfort_views.route('/visualize-recommendations')
     def visualize_recommendations() -> Any:
@@ -142,17 +252,104 @@ def construct_blueprint(comfort_graph: ComfortFoodGraph) -> Blueprint:
         # Fetch the recommendations argument
         recommendations = ast.literal_eval(request.args['recommendations'].strip())
 
-        # Visualize the results
-        subgraph = comfort_graph.create_subgraph(recommendations)
-        visualization.visualize_comfort_food_recommendations(subgraph)
+        # Start creating the figure in the background; the page fetches it once it is ready
+        graph, _ = current()
+        with metrics.stage('figure_request'):
+            get_figures().request_figure(graph, recommendations)
+
+        return _render('visualization.html',
+                       figure_url=url_for('views.figure',
+                                          recommendations=','.join(recommendations)),
+                       back_url=url_for('views.display_recommendations',
+                                        keyword=keyword, food1=food1, food2=food2,
+                                        food3=food3,
+                                        recommendations=','.join(recommendations)))
+
+    @comfort_views.route('/api/figure')
+    def figure() -> Any:
+        """Route to return the plotly figure visualizing the recommendations from the GET
+        method as JSON, or a 202 response if the figure is still being created.
+        """
+        recommendations = [food.strip() for food in
+                           request.args.get('recommendations', '').split(',')
+                           if food.strip() != '']
 
-        return redirect(url_for('views.display_recommendations',
-                                keyword=keyword, food1=food1, food2=food2, food3=food3,
-                                recommendations=','.join(recommendations)))
+        graph, _ = current()
+
+        if any(food not in graph.get_foods() for food in recommendations):
+            return jsonify(error='Unknown food.'), 400
+
+        future = get_figures().request_figure(graph, recommendations)
+
+        if not future.done():
+            return jsonify(status='pending'), 202
+        elif future.exception() is not None:
+            return jsonify(error='The figure could not be created.'), 500
+        else:
+            return Response(future.result(), mimetype='application/json')
+
+    @comfort_views.route('/api/recommendations')
+    def api_recommendations() -> Any:
+        """Route to return recommendations for comfort meals as JSON, in a single response,
+        based on the arguments from the GET method.
+        """
+        graph, graph_engine = current()
+        status, body = api.recommendation_response(graph, request.args, graph_engine, cache,
+                                                   scorer, warmup)
+        return jsonify(body), status
+
+    @comfort_views.route('/api/respondents', methods=['POST'])
+    def add_respondents() -> Any:
+        """Route to add new survey respondents to the graph while the app is running.
+
+        The request body is a JSON object with a list of "respondents", each an object with
+        a list of "foods" and a list of "reasons". The response holds the version of the
+        graph they were added in.
+        """
+        if live is None:
+            return jsonify(error='The graph cannot be changed.'), 404
+
+        body = request.get_json(silent=True)
+        respondents = body.get('respondents') if isinstance(body, dict) else None
+
+        if not isinstance(respondents, list) or \
+                any(not _is_respondent(respondent) for respondent in respondents):
+            return jsonify(error='respondents must be a list of objects with a non-empty list '
+                                 'of foods and a list of reasons.'), 400
+
+        version = live.add_respondents([([food.strip() for food in respondent['foods']],
+                                         [reason.strip() for reason in respondent['reasons']])
+                                        for respondent in respondents])
+
+        return jsonify(added=len(respondents), graph_version=version)
+
+    @comfort_views.route('/metrics')
+    def prometheus_metrics() -> Any:
+        """Route to return the recorded metrics in the Prometheus text format."""
+        if not metrics.is_enabled():
+            return jsonify(error='Metrics are disabled.'), 404
+
+        return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+    @comfort_views.route('/debug/profile/<int:profile_id>')
+    def profile(profile_id: int) -> Any:
+        """Route to return the folded stacks of a profiled request."""
+        folded = profiles.get(profile_id) if profiles is not None else None
+
+        if folded is None:
+            return jsonify(error='Unknown profile.'), 404
+
+        return Response(folded, mimetype='text/plain')
 
     return comfort_views
 
 
+def _render(template: str, **context: Any) -> str:
+    """Render the template with the given context, timing it as a stage."""
+    with metrics.stage('render_template'):
+        return render_template(template, **context)
+
+
 def _check_inputs(keyword: str, food1: str, food2: str, food3: str) -> Optional:
     """Return a redirect object if the inputs did not pass the error handling check.
     """
@@ -174,6 +371,20 @@ def _check_inputs(keyword: str, food1: str, food2: str, food3: str) -> Optional:
     return None
 
 
+def _is_respondent(respondent: Any) -> bool:
+    """Return whether respondent is a JSON object with a non-empty list of non-empty
+    "foods" and a list of non-empty "reasons".
+    """
+    if not isinstance(respondent, dict):
+        return False
+
+    foods = respondent.get('foods')
+    reasons = respondent.get('reasons')
+
+    return isinstance(foods, list) and isinstance(reasons, list) and len(foods) > 0 \
+        and all(isinstance(value, str) and value.strip() != '' for value in foods + reasons)
+
+
 def _check_duplicates_ignore_case(values: list[str]) -> bool:
     """Return whether there is a duplicate value among values, ignoring case and
     empty strings.
@@ -4,41 +4,76 @@ by Kenneth Tran
 
 Visualizes the results from the recommender systems as plotly figures.
 """
-import networkx as nx
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Hashable, Optional, Union
+
+import numpy as np
 
 import plotly.offline
 import plotly.graph_objects as go
 from plotly.graph_objs import Scatter, Figure
 
-from graph import ComfortFoodGraph
+from graph import ComfortFoodGraph, ComfortFoodSubgraphView
+
+# Draw at most this many users in a figure by default
+DEFAULT_MAX_USER_NODES = 2000
 
+# The graph of each worker process of a FigureService, given once by _init_worker
+_worker_graph: Optional[ComfortFoodGraph] = None
 
-def visualize_comfort_food_recommendations(graph: ComfortFoodGraph) -> None:
-    """Use plotly and networkx to visualize the graph.
+
+def visualize_comfort_food_recommendations(
+        graph: Union[ComfortFoodGraph, ComfortFoodSubgraphView]) -> None:
+    """Use plotly to visualize the graph.
     """
-    graph_nx = graph.to_networkx()
+    fig = create_comfort_food_figure(graph)
 
-    # Fetch positioning for bipartite graph layout
-    left_or_top = graph.get_users()
-    pos = nx.bipartite_layout(graph_nx, left_or_top)
+    # Save the figure to an html file
+    plotly.offline.plot(fig)
 
-    x_nodes = [pos[k][0] for k in graph_nx.nodes]
-    y_nodes = [pos[k][1] for k in graph_nx.nodes]
-    x_edges = []
-    y_edges = []
 
-    labels = []
+def create_comfort_food_figure(graph: Union[ComfortFoodGraph, ComfortFoodSubgraphView],
+                               max_user_nodes: int = DEFAULT_MAX_USER_NODES) -> Figure:
+    """Return a plotly figure visualizing the graph, with the users on the left and the
+    foods on the right.
 
-    # Colour nodes based on their number of connections
-    node_adjacencies = []
+    If the graph has more than max_user_nodes users, only max_user_nodes of them (evenly
+    spread over all users) are drawn, along with their edges. The number of connections
+    shown for each node still counts every user.
+    """
+    users = list(graph.get_users())
+    foods = list(graph.get_foods())
 
-    for adjacencies in graph_nx.adjacency():
-        node_adjacencies.append(len(adjacencies[1]))
-        labels.append(f'{adjacencies[0]}<br># of connections: {len(adjacencies[1])}')
+    shown_users = _downsample(users, max_user_nodes)
+    nodes = shown_users + foods
+    node_indices = {node: i for i, node in enumerate(nodes)}
 
-    for edge in graph_nx.edges:
-        x_edges += [pos[edge[0]][0], pos[edge[1]][0], None]
-        y_edges += [pos[edge[0]][1], pos[edge[1]][1], None]
+    # Fetch positioning for bipartite graph layout, in the same order as nodes
+    node_positions = bipartite_layout(len(shown_users), len(foods))
+
+    # Every edge as a pair of node indices
+    edges = np.fromiter((node_indices[node] for food in foods
+                         for user in graph.get_neighbours(food) if user in node_indices
+                         for node in (user, food)), dtype=np.intp).reshape(-1, 2)
+
+    x_nodes = node_positions[:, 0]
+    y_nodes = node_positions[:, 1]
+    x_edges = _edge_coordinates(x_nodes, edges)
+    y_edges = _edge_coordinates(y_nodes, edges)
+
+    # Colour nodes based on their number of connections
+    # (counting every user, not only the users that are shown)
+    node_adjacencies = [graph.get_degree(node) for node in nodes]
+    labels = [f'{node}<br># of connections: {adjacency}'
+              for node, adjacency in zip(nodes, node_adjacencies)]
+
+    title = '<b>People who liked the foods recommended to you</b>'
+    if len(shown_users) < len(users):
+        title += f' (showing {len(shown_users)} of {len(users)} people)'
+    title += '<br><a href="https://www.kaggle.com/borapajo/food-choices">' \
+             'Dataset: Food choices from Kaggle</a>'
 
     # Create the edge and node traces
     edge_trace = Scatter(
@@ -76,13 +111,167 @@ def visualize_comfort_food_recommendations(graph: ComfortFoodGraph) -> None:
 
     fig = Figure(data=[edge_trace, node_trace],
                  layout=go.Layout(
-                     title='<b>People who liked the foods recommended to you</b>'
-                           '<br><a href="https://www.kaggle.com/borapajo/food-choices">'
-                           'Dataset: Food choices from Kaggle</a>',
+                     title=title,
                      showlegend=False,
                      xaxis=dict(showgrid=False, zeroline=False, visible=False),
                      yaxis=dict(showgrid=False, zeroline=False, visible=False)
                  ))
 
-    # Save the figure to an html file
-    plotly.offline.plot(fig)
+    return fig
+
+
+def bipartite_layout(num_left: int, num_right: int, aspect_ratio: float = 4 / 3) \
+        -> np.ndarray:
+    """Return the positions of the nodes of a bipartite graph with num_left nodes on the left
+    followed by num_right nodes on the right, as an array with one (x, y) row per node.
+
+    The positions are the same as networkx.bipartite_layout with the default (vertical)
+    alignment (except that the nodes keep their order within each side), without having to
+    convert the graph to networkx: each side is spread evenly on a vertical line, then the
+    layout is centred on (0, 0) and scaled to fit in [-1, 1].
+
+    >>> bipartite_layout(1, 1).tolist()
+    [[-1.0, 0.0], [1.0, 0.0]]
+    """
+    height = 1
+    width = aspect_ratio * height
+
+    positions = np.zeros((num_left + num_right, 2))
+    positions[num_left:, 0] = width
+    positions[:num_left, 1] = np.linspace(0, height, num_left)
+    positions[num_left:, 1] = np.linspace(0, height, num_right)
+
+    # Centre and rescale the layout, as networkx.rescale_layout does
+    if len(positions) > 0:
+        positions -= positions.mean(axis=0)
+        limit = np.abs(positions).max()
+
+        if limit > 0:
+            positions *= 1 / limit
+
+    return positions
+
+
+def _downsample(users: list[str], max_users: int) -> list[str]:
+    """Return at most max_users users, evenly spread over users and in the same order.
+
+    >>> _downsample(['a', 'b', 'c', 'd', 'e', 'f'], 3)
+    ['a', 'c', 'e']
+    """
+    if len(users) <= max_users:
+        return users
+
+    step = len(users) / max_users
+    return [users[int(i * step)] for i in range(max_users)]
+
+
+def _edge_coordinates(node_coordinates: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Return the coordinates of the line segments of every edge in one buffer: the
+    coordinates of the two ends of each edge, followed by NaN to separate the segments
+    (plotly serializes NaN as null, which breaks the line).
+    """
+    coordinates = np.full(3 * len(edges), np.nan)
+    coordinates[0::3] = node_coordinates[edges[:, 0]]
+    coordinates[1::3] = node_coordinates[edges[:, 1]]
+
+    return coordinates
+
+
+class FigureService:
+    """Creates the figures visualizing recommendations in a pool of worker processes, and
+    caches them as plotly JSON.
+
+    Each worker process is given the graph once, when it starts, so that a figure request
+    only sends its foods. The pool is replaced by a new one when figures are requested for
+    a newer version of the graph. Figures are cached per recommendation set (and graph
+    version), so visiting the visualization of the same recommendations again does not
+    compute their layout or figure again.
+
+    Instance Attributes:
+        - processes: The number of worker processes, or None for one per CPU
+        - maxsize: The maximum number of figures in the cache
+    """
+    processes: Optional[int]
+    maxsize: int
+
+    # Private Instance Attributes:
+    #   - _executor: The pool of worker processes creating the figures, or None if no figure
+    #       has been requested yet
+    #   - _version: The version of the graph given to the worker processes of _executor
+    #   - _figures: Maps each cache key to the future plotly JSON of its figure, from least
+    #       to most recently used
+    #   - _lock: The lock guarding _executor, _version and _figures
+    _executor: Optional[ProcessPoolExecutor]
+    _version: Optional[int]
+    _figures: OrderedDict[Hashable, Future]
+    _lock: threading.Lock
+
+    def __init__(self, processes: Optional[int] = None, maxsize: int = 128) -> None:
+        """Initialize a service with a pool of `processes` worker processes (by default, one
+        per CPU) and a cache of at most maxsize figures.
+        """
+        self.processes = processes
+        self.maxsize = maxsize
+        self._executor = None
+        self._version = None
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def request_figure(self, graph: ComfortFoodGraph, foods: list[str]) -> Future:
+        """Return a future for the plotly JSON of the figure visualizing the given recommended
+        foods of graph, starting to create the figure if it is not cached yet.
+
+        Graphs only ever grow, so a request for an older version of the graph than the one
+        the worker processes have is answered from their newer version.
+        """
+        with self._lock:
+            if self._executor is None or graph.version > self._version:
+                self._replace_executor(graph)
+
+            key = (self._version, frozenset(foods))
+            future = self._figures.get(key)
+
+            # Retry figures that failed to be created
+            if future is not None and not (future.done() and future.exception() is not None):
+                self._figures.move_to_end(key)
+                return future
+
+            future = self._executor.submit(_create_figure_json, foods)
+            self._figures[key] = future
+
+            if len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+
+            return future
+
+    def _replace_executor(self, graph: ComfortFoodGraph) -> None:
+        """Replace the pool of worker processes by one for graph, dropping the figures of
+        the previous graph. Figures already being created by the old pool are finished.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+        # Worker processes are only started (and sent the graph) on the first submission
+        self._executor = ProcessPoolExecutor(self.processes, initializer=_init_worker,
+                                             initargs=(graph,))
+        self._version = graph.version
+        self._figures.clear()
+
+    def shutdown(self) -> None:
+        """Stop the worker processes of this service."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+
+
+def _init_worker(graph: ComfortFoodGraph) -> None:
+    """Store the graph of a worker process of a FigureService."""
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _create_figure_json(foods: list[str]) -> str:
+    """Return the plotly JSON of the figure visualizing the given foods of the graph of this
+    worker process.
+    """
+    return create_comfort_food_figure(_worker_graph.subgraph_view(foods)).to_json()
@@ -0,0 +1,139 @@
+"""
+FoodFinder
+by Kenneth Tran
+
+Precompute the candidates of every recommendation query at startup.
+"""
+
+import itertools
+import sys
+import time
+from array import array
+from typing import Iterator
+
+from graph import ComfortFoodGraph
+from similarity import SimilarityEngine
+
+
+class WarmupTable:
+    """A table of the foods associated with each reason and of the foods similar to each
+    food, ranked by similarity, built in one warm-up pass over the graph.
+
+    The recommendations for a single liked food are then a merge of its ranked candidates
+    that are associated with the keyword, followed by the rest of its ranked candidates,
+    without scoring or sorting anything. For several liked foods, the table serves as the
+    `engine` of the scoring, like a SimilarityEngine. The table is rebuilt if the graph
+    changes.
+
+    Instance Attributes:
+        - graph: The graph this table was built from
+        - build_seconds: The number of seconds the last warm-up took
+    """
+    graph: ComfortFoodGraph
+    build_seconds: float
+
+    # Private Instance Attributes:
+    #   - _version: The version of the graph the table was built from
+    #   - _boosted: Maps each reason to the ids of the foods with at least one edge with that
+    #       reason
+    #   - _ranked_ids: Maps each food id to the ids of the foods that share a user with it
+    #       (including itself), by descending similarity and then by id
+    #   - _ranked_similarities: Maps each food id to the similarities of its ranked foods
+    _version: int
+    _boosted: dict[str, frozenset[int]]
+    _ranked_ids: dict[int, array]
+    _ranked_similarities: dict[int, array]
+
+    def __init__(self, graph: ComfortFoodGraph) -> None:
+        """Build the table of graph."""
+        self.graph = graph
+        self._build()
+
+    def _build(self) -> None:
+        """(Re)build the table from the current state of the graph."""
+        start = time.perf_counter()
+        engine = SimilarityEngine(self.graph)
+
+        self._version = self.graph.version
+        self._boosted = {reason: frozenset(self.graph.get_vertex_id(food) for food in
+                                           self.graph.get_foods_with_reason(reason))
+                         for reason in self.graph.get_all_reasons()}
+        self._ranked_ids = {}
+        self._ranked_similarities = {}
+
+        for food in self.graph.get_foods():
+            ranked = sorted((-sim, self.graph.get_vertex_id(other))
+                            for other, sim in engine.similarities(food).items())
+
+            food_id = self.graph.get_vertex_id(food)
+            self._ranked_ids[food_id] = array('q', (other_id for _, other_id in ranked))
+            self._ranked_similarities[food_id] = array('d', (-sim for sim, _ in ranked))
+
+        self.build_seconds = time.perf_counter() - start
+
+    @property
+    def nbytes(self) -> int:
+        """The approximate number of bytes of memory used by this table."""
+        return sys.getsizeof(self._boosted) + sys.getsizeof(self._ranked_ids) \
+            + sys.getsizeof(self._ranked_similarities) \
+            + sum(sys.getsizeof(food_ids) for food_ids in self._boosted.values()) \
+            + sum(sys.getsizeof(food_ids) for food_ids in self._ranked_ids.values()) \
+            + sum(sys.getsizeof(sims) for sims in self._ranked_similarities.values())
+
+    def similarities(self, food: str) -> dict[str, float]:
+        """Return the Jaccard similarity between food and every food that shares at least
+        one user with it, as SimilarityEngine.similarities would.
+
+        Raise a ValueError if food is not a food vertex in the graph.
+        """
+        if self._version != self.graph.version:
+            self._build()
+
+        if self.graph.get_vertex_type(food) != 'food':
+            raise ValueError
+
+        food_id = self.graph.get_vertex_id(food)
+        return {self.graph.get_vertex_value(other_id): sim for other_id, sim in
+                zip(self._ranked_ids[food_id], self._ranked_similarities[food_id])}
+
+    def recommend(self, keyword: str, liked_food: str, limit: int, offset: int = 0) \
+            -> list[str]:
+        """Return the same recommendations as recommendation.recommend_comfort_foods for
+        the single liked food, merged from the precomputed lists.
+
+        Raise a ValueError if liked_food is not a food vertex in the graph.
+        """
+        return list(self.recommend_scores(keyword, liked_food, limit, offset))
+
+    def recommend_scores(self, keyword: str, liked_food: str, limit: int, offset: int = 0) \
+            -> dict[str, float]:
+        """Return the recommendations of recommend, in the same order, each mapped to the
+        score recommendation.score_comfort_foods would give it.
+
+        Raise a ValueError if liked_food is not a food vertex in the graph.
+        """
+        if self._version != self.graph.version:
+            self._build()
+
+        if self.graph.get_vertex_type(liked_food) != 'food':
+            raise ValueError
+
+        liked_id = self.graph.get_vertex_id(liked_food)
+        boosted = self._boosted.get(keyword, frozenset())
+
+        # Every associated food scores 5 more than its similarity, which is at most 1, so
+        # they all rank before the other foods, and both groups rank by similarity
+        ranked = itertools.chain(self._ranked_filter(liked_id, boosted, True),
+                                 self._ranked_filter(liked_id, boosted, False))
+
+        return {self.graph.get_vertex_value(food_id): sim + 5 if food_id in boosted else sim
+                for food_id, sim in itertools.islice(ranked, offset, offset + limit)}
+
+    def _ranked_filter(self, liked_id: int, boosted: frozenset[int],
+                       is_boosted: bool) -> Iterator[tuple[int, float]]:
+        """Yield the ranked candidates of the food with id liked_id, other than itself,
+        that are (or are not, if is_boosted is False) in boosted, with their similarities.
+        """
+        for food_id, sim in zip(self._ranked_ids[liked_id], self._ranked_similarities[liked_id]):
+            if food_id != liked_id and (food_id in boosted) == is_boosted:
+                yield food_id, sim